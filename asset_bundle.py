@@ -0,0 +1,219 @@
+"""
+Offline asset bake: checks that every card template in card_database has its art,
+composes each template's background and character once, and packs the raw RGBA
+layers into one bundle file that imgen memory-maps, so renders never open or
+decode a PNG.
+
+Usage:
+  python asset_bundle.py                  # bake assets.bundle, failing on missing art
+  python asset_bundle.py --check          # only validate the asset tree
+  python asset_bundle.py --allow-missing  # bake whatever is valid, report the rest
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import argparse
+
+# Where the bake writes the bundle and the renderer looks for it.
+ASSET_BUNDLE = os.getenv("ASSET_BUNDLE", "assets.bundle")
+
+# File layout: MAGIC, a header of (format version, manifest length), the manifest
+# as UTF-8 JSON, then each layer's raw pixels starting on a page boundary.
+MAGIC = b"CARDBNDL"
+BUNDLE_VERSION = 1
+_HEADER = struct.Struct("<II")
+ALIGNMENT = mmap.ALLOCATIONGRANULARITY
+
+def _portable(path: str) -> str:
+    return os.path.normpath(path).replace("\\", "/")
+
+def layer_key(background_path: str, character_path: str) -> str:
+    """Manifest key of the base layer built from a background and a character image."""
+    return _portable(background_path) + "|" + _portable(character_path)
+
+def _source_info(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def validate_templates(templates: list) -> tuple:
+    """
+    Check every template's background and character art. Returns (layers, problems):
+    layers maps layer_key -> (background path, character path, templates using it)
+    for templates whose art is all present; problems lists what is wrong with the rest.
+    """
+    from imgen import BACKGROUND_RARITIES, get_background_path, get_character_image_path
+    layers = {}
+    problems = []
+    for template in templates:
+        label = f"{template['name']} ({template['set']}, {template['rarity']}, {template.get('variant') or 'no variant'})"
+        if template["rarity"].lower() not in BACKGROUND_RARITIES:
+            problems.append(f"{label}: no background for rarity {template['rarity']!r}")
+            continue
+        background = get_background_path(template["rarity"])
+        character = get_character_image_path(template["set"], template["name"], template.get("variant"))
+        missing = [path for path in (background, character) if not os.path.isfile(path)]
+        if missing:
+            problems.append(f"{label}: missing {', '.join(missing)}")
+            continue
+        key = layer_key(background, character)
+        layers.setdefault(key, (background, character, []))[2].append(template)
+    return layers, problems
+
+def unused_art(layers: dict) -> list:
+    """Character images under the asset tree that no template uses."""
+    from imgen import CHARACTER_DIR
+    used = {os.path.normpath(character) for _, character, _ in layers.values()}
+    unused = []
+    for directory, _, files in os.walk(CHARACTER_DIR):
+        for name in sorted(files):
+            path = os.path.normpath(os.path.join(directory, name))
+            if name.lower().endswith(".png") and path not in used:
+                unused.append(path)
+    return unused
+
+def bake(layers: dict, path: str = ASSET_BUNDLE) -> dict:
+    """Compose every layer and write the bundle to path (atomically); returns the manifest."""
+    from imgen import _compose_base_layer
+    entries = {}
+    pixels = []
+    offset = 0
+    for key, (background, character, users) in layers.items():
+        layer = _compose_base_layer(background, character)
+        if layer is None:
+            raise ValueError(f"Could not compose {key}")
+        data = layer.tobytes()
+        entries[key] = {
+            "offset": offset,
+            "length": len(data),
+            "size": list(layer.size),
+            "mode": layer.mode,
+            "sources": {_portable(background): _source_info(background), _portable(character): _source_info(character)},
+            "templates": [f"{template['name']}|{template['set']}|{template['rarity']}|{template.get('variant') or ''}"
+                          for template in users]
+        }
+        pixels.append(data)
+        offset += -(-len(data) // ALIGNMENT) * ALIGNMENT
+
+    manifest = {"version": BUNDLE_VERSION, "baked_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "layers": entries}
+    manifest_bytes = json.dumps(manifest, indent=1).encode("utf-8")
+    data_start = -(-(len(MAGIC) + _HEADER.size + len(manifest_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + _HEADER.pack(BUNDLE_VERSION, len(manifest_bytes)) + manifest_bytes)
+        for entry, data in zip(entries.values(), pixels):
+            f.seek(data_start + entry["offset"])
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return manifest
+
+class AssetBundle:
+    """
+    A baked bundle, memory-mapped read-only. layer(key) returns the base layer as a
+    read-only Image backed directly by the mapping, so it costs no decode and no
+    private memory; render workers share the pages through the OS page cache.
+
+    Layers whose source art changed after the bake (by size or modification time,
+    checked once when the bundle is opened) or that were dropped with
+    discard_source() are left out, and the renderer falls back to the files.
+    """
+
+    def __init__(self, path: str = ASSET_BUNDLE):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an asset bundle")
+        version, manifest_length = _HEADER.unpack_from(self.map, len(MAGIC))
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"{path} has bundle format {version}, expected {BUNDLE_VERSION}; bake it again")
+        manifest_start = len(MAGIC) + _HEADER.size
+        self.manifest = json.loads(self.map[manifest_start:manifest_start + manifest_length])
+        self.data_start = -(-(manifest_start + manifest_length) // ALIGNMENT) * ALIGNMENT
+        self.images = {}  # key -> Image over the mapping, made on first use
+        self.stale = [key for key, entry in self.manifest["layers"].items() if not self._is_current(entry)]
+        self.layers = {key: entry for key, entry in self.manifest["layers"].items() if key not in self.stale}
+
+    @staticmethod
+    def _is_current(entry: dict) -> bool:
+        for source, info in entry["sources"].items():
+            try:
+                if _source_info(source) != info:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def layer(self, key: str):
+        """The base layer for key, or None if the bundle doesn't have a current copy."""
+        image = self.images.get(key)
+        if image is None:
+            entry = self.layers.get(key)
+            if entry is None:
+                return None
+            from PIL import Image
+            start = self.data_start + entry["offset"]
+            buffer = memoryview(self.map)[start:start + entry["length"]]
+            image = self.images[key] = Image.frombuffer(entry["mode"], tuple(entry["size"]), buffer,
+                                                        "raw", entry["mode"], 0, 1)
+        return image
+
+    def discard_source(self, path: str) -> None:
+        """Stop serving layers built from path (e.g. after its art was replaced)."""
+        path = os.path.normpath(path)
+        for key, entry in list(self.layers.items()):
+            if path in (os.path.normpath(source) for source in entry["sources"]):
+                del self.layers[key]
+                self.images.pop(key, None)
+
+def open_bundle(path: str = ASSET_BUNDLE):
+    """Open the bundle at path, or return None (with a note why) if it is missing or unusable."""
+    if not os.path.exists(path):
+        return None
+    try:
+        bundle = AssetBundle(path)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring asset bundle {path}: {e}")
+        return None
+    if bundle.stale:
+        print(f"Asset bundle {path} is out of date for {len(bundle.stale)} layers; "
+              f"run python asset_bundle.py to bake it again")
+    return bundle
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Validate card art and bake it into a memory-mapped bundle.")
+    parser.add_argument("--output", default=ASSET_BUNDLE, help="where to write the bundle")
+    parser.add_argument("--check", action="store_true", help="only validate the asset tree")
+    parser.add_argument("--allow-missing", action="store_true",
+                        help="bake the templates whose art is present even if others are missing")
+    args = parser.parse_args(argv)
+
+    from card_database import get_all_cards
+    templates = get_all_cards()
+    started = time.perf_counter()
+    layers, problems = validate_templates(templates)
+    for problem in problems:
+        print(f"Missing art: {problem}")
+    for path in unused_art(layers):
+        print(f"Unused art: {path}")
+    print(f"{len(templates) - len(problems)} of {len(templates)} templates have their art "
+          f"({len(layers)} distinct layers)")
+    if args.check:
+        return 1 if problems else 0
+    if problems and not args.allow_missing:
+        print("Not baking; add the missing art or pass --allow-missing")
+        return 1
+
+    manifest = bake(layers, args.output)
+    size = os.path.getsize(args.output)
+    print(f"Baked {len(manifest['layers'])} layers into {args.output} ({size / (1024 * 1024):.0f} MB) "
+          f"in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
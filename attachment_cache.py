@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+import aiohttp
+import metrics
+
+# Where attachment URLs are remembered between restarts.
+ATTACHMENT_CACHE_FILE = os.getenv("ATTACHMENT_CACHE_FILE", os.path.join("cache", "attachments.json"))
+# Maximum number of remembered URLs.
+ATTACHMENT_CACHE_SIZE = int(os.getenv("ATTACHMENT_CACHE_SIZE", "50000"))
+# Skip URLs whose signature expires within this many seconds.
+ATTACHMENT_EXPIRY_MARGIN = 3600
+# Seconds to wait after a new URL before writing the cache file, so bursts share one write.
+ATTACHMENT_SAVE_DELAY = 5
+# Set to "0" to trust remembered URLs without asking the CDN first.
+ATTACHMENT_VERIFY = os.getenv("ATTACHMENT_VERIFY", "1") != "0"
+
+def url_expiry(url: str):
+    """
+    Return when a Discord CDN URL stops working (unix time), or None if unknown.
+    Attachment URLs are signed, with the expiry as a hex timestamp in the "ex" parameter.
+    """
+    ex = parse_qs(urlparse(url).query).get("ex")
+    if not ex:
+        return None
+    try:
+        return int(ex[0], 16)
+    except ValueError:
+        return None
+
+class HttpUrlChecker:
+    """Checks that a remembered URL still serves the image, with a HEAD request."""
+
+    def __init__(self, timeout: float = 3):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+
+    async def is_available(self, url: str) -> bool:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+        try:
+            async with self.session.head(url, allow_redirects=True) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+
+class AttachmentUrlCache:
+    """
+    Remembers the Discord CDN URL of each uploaded card image, keyed by the card's
+    content hash (render_cache.card_cache_key), so later embeds can point at the
+    existing upload instead of sending the image again.
+
+    The checker is any object with an async is_available(url) method; pass a local
+    stand-in to test without the Discord CDN, or None to skip the check.
+    """
+
+    def __init__(self, path: str = ATTACHMENT_CACHE_FILE, max_entries: int = ATTACHMENT_CACHE_SIZE,
+                 checker=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.checker = checker
+        self.urls = None  # key -> url, least recently used first; loaded on first use
+        self.lock = threading.Lock()
+        self.save_scheduled = False
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r") as f:
+                self.urls = OrderedDict(json.load(f))
+        except (FileNotFoundError, ValueError):
+            self.urls = OrderedDict()
+
+    def save(self) -> None:
+        with self.lock:
+            self.save_scheduled = False
+            if self.urls is None:
+                return
+            snapshot = list(self.urls.items())
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving attachment cache: {e}")
+
+    def _schedule_save(self) -> None:
+        """Save from a worker thread a few seconds from now, unless a save is already due."""
+        with self.lock:
+            if self.save_scheduled:
+                return
+            self.save_scheduled = True
+        loop = asyncio.get_running_loop()
+        loop.call_later(ATTACHMENT_SAVE_DELAY, loop.run_in_executor, None, self.save)
+
+    def get(self, key: str):
+        """Return the remembered URL for a card if it has not expired, else None."""
+        with self.lock:
+            if self.urls is None:
+                self._load()
+            url = self.urls.get(key)
+            if url is None:
+                self.misses += 1
+                return None
+            expiry = url_expiry(url)
+            if expiry is not None and expiry - time.time() < ATTACHMENT_EXPIRY_MARGIN:
+                del self.urls[key]
+                self.misses += 1
+                return None
+            self.urls.move_to_end(key)
+            return url
+
+    async def lookup(self, key: str):
+        """Like get(), but also confirms the URL still works using the checker."""
+        url = self.get(key)
+        if url is None:
+            return None
+        if self.checker is not None and not await self.checker.is_available(url):
+            self.forget(key)
+            return None
+        with self.lock:
+            self.hits += 1
+        return url
+
+    def record(self, key: str, url: str) -> None:
+        with self.lock:
+            if self.urls is None:
+                self._load()
+            self.urls[key] = url
+            self.urls.move_to_end(key)
+            while len(self.urls) > self.max_entries:
+                self.urls.popitem(last=False)
+
+    def forget(self, key: str) -> None:
+        with self.lock:
+            if self.urls is not None:
+                self.urls.pop(key, None)
+
+    def record_message(self, message, keys_by_filename: dict) -> None:
+        """Remember the URLs of a sent message's attachments, matched by file name."""
+        for attachment in getattr(message, "attachments", None) or []:
+            key = keys_by_filename.get(attachment.filename)
+            if key is not None:
+                self.record(key, attachment.url)
+        self._schedule_save()
+
+    async def close(self) -> None:
+        self.save()
+        if self.checker is not None and hasattr(self.checker, "close"):
+            await self.checker.close()
+
+# Shared cache used by the cogs.
+attachment_cache = AttachmentUrlCache(checker=HttpUrlChecker() if ATTACHMENT_VERIFY else None)
+metrics.register_cache("attachment", lambda: (attachment_cache.hits, attachment_cache.misses))
@@ -0,0 +1,320 @@
+"""
+Benchmarks for the bot's hot paths: template sampling, card generation, serial
+allocation, card rendering, persistence and the collection indexes.
+
+Every scenario runs against synthetic collections built from a fixed seed, in a
+temporary directory, so runs are repeatable and never touch the bot's data.
+Each benchmark reports the median time per operation and the peak memory it
+allocated; results are written to a JSON file that can be compared with a
+stored baseline.
+
+Usage:
+  python benchmark.py                                   # everything, default sizes
+  python benchmark.py --sizes 1000,1000000 --only persistence,index
+  python benchmark.py --output new.json --baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+# Synthetic collection sizes (total cards) used when --sizes is not given.
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+# Average cards per synthetic user.
+CARDS_PER_USER = 50
+# Seed for every random choice the benchmarks make.
+SEED = 1234
+# Slowdown against the baseline, as a fraction, that counts as a regression.
+REGRESSION_THRESHOLD = 0.10
+# Benchmark groups, in the order they run.
+GROUPS = ("sampler", "generation", "serial", "render", "persistence", "index")
+
+def synthetic_collections(card_count: int, user_count: int = None, seed: int = SEED) -> dict:
+    """
+    Build user_id -> list of card dicts (the collections.json shape) holding
+    card_count cards drawn with the real drop weights. Cards are spread unevenly,
+    as in a real server: a few heavy collectors and many light ones.
+    """
+    from card_database import TemplateSampler, get_all_cards, serial_prefix
+    rng = random.Random(seed)
+    user_count = user_count or max(card_count // CARDS_PER_USER, 1)
+    user_keys = [str(10 ** 17 + i) for i in range(user_count)]
+    sampler = TemplateSampler(get_all_cards(), rng)
+    numbers = {}
+    collections = {}
+    for template in sampler.draw(card_count):
+        prefix = serial_prefix(template["name"], template["rarity"], template["set"])
+        numbers[prefix] = numbers.get(prefix, 0) + 1
+        user_key = user_keys[int(user_count * rng.random() ** 2)]
+        collections.setdefault(user_key, []).append({
+            "serial_number": f"{prefix}-{numbers[prefix]}",
+            "name": template["name"],
+            "set": template["set"],
+            "rarity": template["rarity"],
+            "stats": {stat: value + rng.randint(-10, 10) for stat, value in template["base_stats"].items()}
+        })
+    return collections
+
+class BenchmarkRunner:
+    """Times benchmark functions and collects their results."""
+
+    def __init__(self, repeat: int = 5):
+        self.repeat = repeat
+        self.results = {}
+
+    def run(self, name: str, fn, ops: int = 1, setup=None, repeat: int = None) -> None:
+        """
+        Time fn(state) `repeat` times, where state is setup()'s result (setup is not
+        timed), then once more under tracemalloc for its peak memory allocation.
+        ops is how many operations one call of fn performs.
+        """
+        times = []
+        for _ in range(repeat or self.repeat):
+            state = setup() if setup else None
+            started = time.perf_counter()
+            fn(state)
+            times.append(time.perf_counter() - started)
+
+        state = setup() if setup else None
+        tracemalloc.start()
+        fn(state)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        median = statistics.median(times)
+        self.results[name] = {
+            "ops": ops,
+            "median_s": median,
+            "min_s": min(times),
+            "per_op_us": median / ops * 1e6,
+            "peak_kb": peak // 1024
+        }
+        print(f"  {name:<48} {median / ops * 1e6:>12,.1f} us/op {peak / 1024:>10,.0f} KiB peak")
+
+    def skip(self, name: str, reason: str) -> None:
+        print(f"  {name:<48} skipped: {reason}")
+
+def bench_sampler(runner: BenchmarkRunner, sizes) -> None:
+    import card_database
+    rng = random.Random(SEED)
+    runner.run("sampler/get_random_card", lambda _: [card_database.get_random_card(rng) for _ in range(100_000)],
+               ops=100_000)
+    runner.run("sampler/draw_cards", lambda _: card_database.draw_cards(100_000, rng), ops=100_000)
+
+def bench_generation(runner: BenchmarkRunner, sizes) -> None:
+    import responses
+    from storage import SqliteCollectionStore
+    responses.store = SqliteCollectionStore(os.path.join("generation", "bench.db"))
+    rng = random.Random(SEED)
+    runner.run("generation/generate_card", lambda _: [responses.generate_card() for _ in range(1_000)], ops=1_000)
+    runner.run("generation/generate_cards", lambda _: responses.generate_cards(10_000, rng), ops=10_000)
+    if responses.np is not None:
+        numpy, responses.np = responses.np, None
+        runner.run("generation/generate_cards[pure python]", lambda _: responses.generate_cards(10_000, rng),
+                   ops=10_000)
+        responses.np = numpy
+    responses.store.close()
+    responses.store = None
+
+def bench_serial(runner: BenchmarkRunner, sizes) -> None:
+    import responses
+    from storage import SqliteCollectionStore, JsonCollectionStore
+    for backend, store in (("sqlite", SqliteCollectionStore(os.path.join("serial", "bench.db"))),
+                           ("json", JsonCollectionStore(os.path.join("serial", "collections.json")))):
+        responses.store = store
+        runner.run(f"serial/generate_serial_number[{backend}]",
+                   lambda _: [responses.generate_serial_number("Isagi Yoichi", "Common", "Ichinan High")
+                              for _ in range(1_000)],
+                   ops=1_000)
+        store.close()
+    responses.store = None
+
+def bench_render(runner: BenchmarkRunner, sizes) -> None:
+    import imgen
+    from card_model import Card
+    card = Card.from_dict(synthetic_collections(1, seed=SEED).popitem()[1][0])
+    scratch = os.getcwd()
+    # Card art and fonts are looked up relative to the repository.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        context = imgen.get_render_context()
+        for profile in ("full", "webp", "thumbnail"):
+            if imgen.generate_card_image(card, context, profile) is None:
+                runner.skip(f"render/generate_card_image[{profile}]", "rendering failed (missing assets?)")
+                continue
+            runner.run(f"render/generate_card_image[{profile}]",
+                       lambda _: [imgen.generate_card_image(card, context, profile) for _ in range(10)], ops=10)
+    finally:
+        os.chdir(scratch)
+
+def _backends(size: int):
+    from storage import SqliteCollectionStore, JsonCollectionStore, ShardedJsonCollectionStore
+    base = os.path.join("persistence", str(size))
+    os.makedirs(base, exist_ok=True)
+    return (
+        ("json", lambda: JsonCollectionStore(os.path.join(base, "collections.json"))),
+        ("sharded", lambda: ShardedJsonCollectionStore(os.path.join(base, "shards"))),
+        ("sqlite", lambda: SqliteCollectionStore(os.path.join(base, "collections.db")))
+    )
+
+def bench_persistence(runner: BenchmarkRunner, sizes) -> None:
+    import responses
+    from card_model import Card, compact_collections
+    for size in sizes:
+        collections = compact_collections(synthetic_collections(size))
+        user_keys = list(collections)
+        rng = random.Random(SEED)
+        template = synthetic_collections(1, seed=SEED).popitem()[1][0]
+        serials = itertools.count(1)
+
+        def new_cards():
+            # Claims need serial numbers no stored card has.
+            return [Card(template["name"], template["set"], template["rarity"], f"BENCH-{next(serials)}",
+                         template["stats"]) for _ in range(20)]
+        for backend, open_backend in _backends(size):
+            store = open_backend()
+            responses.store = store
+            runner.run(f"persistence/save_collections[{backend},{size}]",
+                       lambda _: responses.save_collections(collections), repeat=3)
+            runner.run(f"persistence/add_card[{backend},{size}]",
+                       lambda cards: [store.add_card(rng.choice(user_keys), card) for card in cards], ops=20,
+                       setup=new_cards)
+            runner.run(f"persistence/load_user[{backend},{size}]",
+                       lambda _: [store.load_user(rng.choice(user_keys)) for _ in range(100)], ops=100)
+            runner.run(f"persistence/iter_collections[{backend},{size}]",
+                       lambda _: sum(len(cards) for _, cards in store.iter_collections()), ops=size, repeat=3)
+            store.close()
+        responses.store = None
+
+def bench_index(runner: BenchmarkRunner, sizes) -> None:
+    from card_model import compact_collections
+    from collection_index import UserCollectionIndex
+    from collection_stats import CollectionStats
+    from search_index import CardSearchIndex
+    for size in sizes:
+        collections = compact_collections(synthetic_collections(size))
+        heaviest = max(collections.values(), key=len)
+
+        def build_search(_):
+            index = CardSearchIndex()
+            index.build(collections.items())
+            return index
+        runner.run(f"index/search_build[{size}]", build_search, ops=size, repeat=3)
+        index = build_search(None)
+        runner.run(f"index/search_query[{size}]",
+                   lambda _: [index.search(query) for query in ("isagi shoot>=45", "serial:MTKZ", "rarity:uc spd<40")
+                              for _ in range(20)],
+                   ops=60)
+        runner.run(f"index/list_page[{size}]",
+                   lambda _: UserCollectionIndex(heaviest).page({"rarity": "Common"}, "stat_total", limit=10),
+                   ops=1)
+
+        def build_stats(_):
+            CollectionStats().build(collections.items())
+        runner.run(f"index/stats_build[{size}]", build_stats, ops=size, repeat=3)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> int:
+    """Print each benchmark against the baseline; returns the number of regressions."""
+    regressions = 0
+    print(f"\nCompared with baseline ({baseline['meta'].get('commit')}, {baseline['meta'].get('date')}):")
+    for name, result in results["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"  {name:<48} new")
+            continue
+        change = result["per_op_us"] / old["per_op_us"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"  {name:<48} {old['per_op_us']:>12,.1f} -> {result['per_op_us']:>12,.1f} us/op "
+              f"{change:>+8.1%}   peak {old['peak_kb']:,} -> {result['peak_kb']:,} KiB{flag}")
+    missing = [name for name in baseline["results"] if name not in results["results"]]
+    if missing:
+        print(f"  ({len(missing)} baseline benchmarks were not run this time)")
+    if regressions:
+        print(f"{regressions} benchmarks are more than {threshold:.0%} slower than the baseline")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the bot's hot paths.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated synthetic collection sizes in cards (e.g. 1000,1000000)")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"comma-separated groups from {', '.join(GROUPS)}")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the results")
+    parser.add_argument("--baseline", help="results file to compare with")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown fraction counted as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    groups = [group for group in args.only.split(",") if group]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    runner = BenchmarkRunner(args.repeat)
+    here = os.getcwd()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory(prefix="cardbot-bench-") as workdir:
+        # Stores and counter files use relative paths; keep all of them in the scratch directory.
+        os.chdir(workdir)
+        for group in ("generation", "serial", "persistence"):
+            os.makedirs(group, exist_ok=True)
+        try:
+            for group in GROUPS:
+                if group in groups:
+                    print(f"{group}:")
+                    globals()[f"bench_{group}"](runner, sizes)
+        finally:
+            os.chdir(here)
+
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": numpy_version,
+            "seed": SEED,
+            "sizes": sizes,
+            "repeat": args.repeat
+        },
+        "results": runner.results
+    }
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"\nWrote {len(runner.results)} results to {output}")
+
+    if baseline is not None and compare(results, baseline, args.threshold):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
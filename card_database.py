@@ -1,4 +1,8 @@
 import random
+try:
+    import numpy as np
+except ImportError:  # Optional; only needed for TemplateSampler.draw_indices.
+    np = None
 
 # Full name -> code mapping.
 # (Note: Avoid duplicates. If you need multiple variants for a given full name,
@@ -167,10 +171,96 @@ def get_all_cards() -> list:
     """Return the complete list of card templates."""
     return CARD_TEMPLATES
 
-def get_random_card() -> dict:
+class TemplateSampler:
+    """
+    Weighted sampler over card templates using Vose's alias method.
+
+    Building the tables is O(n) in the number of templates; each draw is O(1)
+    no matter how many templates there are. Pass a seeded random.Random as rng
+    for reproducible draws.
+    """
+
+    def __init__(self, templates: list, rng: random.Random = None):
+        self.templates = templates
+        self.size = len(templates)
+        self.rng = rng or random  # The module-level functions share the global generator.
+        weights = [template.get("drop_weight", 1) for template in templates]
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("Total of drop weights must be greater than zero")
+
+        # Scale weights so the average column holds exactly 1.0 of probability.
+        scaled = [weight * self.size / total for weight in weights]
+        self.prob = [1.0] * self.size
+        self.alias = list(range(self.size))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left over is 1.0 up to rounding error and keeps prob = 1.0.
+        self._prob_array = None
+        self._alias_array = None
+
+    def draw_one(self, rng: random.Random = None) -> dict:
+        """Return one template."""
+        u = (rng or self.rng).random() * self.size
+        column = int(u)
+        if u - column < self.prob[column]:
+            return self.templates[column]
+        return self.templates[self.alias[column]]
+
+    def draw(self, k: int, rng: random.Random = None) -> list:
+        """Return k independently drawn templates."""
+        rand = (rng or self.rng).random
+        size, prob, alias, templates = self.size, self.prob, self.alias, self.templates
+        result = []
+        for _ in range(k):
+            u = rand() * size
+            column = int(u)
+            result.append(templates[column] if u - column < prob[column] else templates[alias[column]])
+        return result
+
+    def draw_indices(self, k: int, generator) -> "np.ndarray":
+        """
+        Return the positions in templates of k independent draws as a NumPy array,
+        using a numpy.random.Generator. Requires NumPy.
+        """
+        if self._prob_array is None:
+            self._prob_array = np.array(self.prob)
+            self._alias_array = np.array(self.alias, dtype=np.intp)
+        u = generator.random(k) * self.size
+        column = u.astype(np.intp)
+        return np.where(u - column < self._prob_array[column], column, self._alias_array[column])
+
+# Sampler over CARD_TEMPLATES, built on first use.
+_sampler = None
+
+def rebuild_sampler() -> TemplateSampler:
+    """
+    Rebuild the drop sampler from CARD_TEMPLATES. Called automatically when the
+    list is replaced or grows/shrinks; call it by hand after editing drop weights in place.
+    """
+    global _sampler
+    _sampler = TemplateSampler(CARD_TEMPLATES)
+    return _sampler
+
+def get_sampler() -> TemplateSampler:
+    """Return the drop sampler for the current CARD_TEMPLATES."""
+    if _sampler is None or _sampler.templates is not CARD_TEMPLATES or _sampler.size != len(CARD_TEMPLATES):
+        return rebuild_sampler()
+    return _sampler
+
+def get_random_card(rng: random.Random = None) -> dict:
     """Return a random card template from the database using weighted selection."""
-    weights = [template.get("drop_weight", 1) for template in CARD_TEMPLATES]
-    return random.choices(CARD_TEMPLATES, weights=weights, k=1)[0]
+    return get_sampler().draw_one(rng)
+
+def draw_cards(k: int, rng: random.Random = None) -> list:
+    """Return k random card templates in one call using weighted selection."""
+    return get_sampler().draw(k, rng)
 
 def get_char_code(name: str) -> str:
     """
@@ -206,3 +296,10 @@ def get_set_code(card_set: str) -> str:
     if card_set in valid_set_codes or card_set.isupper():
         return card_set
     return SET_CODES.get(card_set, "UN")
+
+def serial_prefix(name: str, rarity: str, card_set: str) -> str:
+    """
+    Return the serial prefix (set, rarity and character codes) of a card;
+    serial numbers count up independently per prefix.
+    """
+    return f"{get_set_code(card_set)}-{get_rarity_code(rarity)}-{get_char_code(name)}"
@@ -0,0 +1,154 @@
+import sys
+import struct
+
+class CardTemplate:
+    """
+    The parts of a card that many cards share: name, set, rarity, variant and the
+    names of its stats. Each distinct combination exists once (see intern_template),
+    and every card of that kind points at it.
+    """
+
+    __slots__ = ("id", "name", "card_set", "rarity", "variant", "stat_names", "stat_codec")
+
+    def __init__(self, template_id: int, name: str, card_set: str, rarity: str, variant, stat_names: tuple):
+        self.id = template_id
+        self.name = sys.intern(name)
+        self.card_set = sys.intern(card_set)
+        self.rarity = sys.intern(rarity)
+        self.variant = sys.intern(variant) if variant is not None else None
+        self.stat_names = tuple(sys.intern(stat) for stat in stat_names)
+        # Stat values are packed as little-endian signed 16-bit integers, in stat_names order.
+        self.stat_codec = struct.Struct(f"<{len(stat_names)}h")
+
+# Every template seen so far, by id and by its identifying fields.
+_templates = []
+_template_ids = {}
+
+def intern_template(name: str, card_set: str, rarity: str, variant, stat_names) -> CardTemplate:
+    """Return the shared CardTemplate for these fields, creating it on first use."""
+    key = (name, card_set, rarity, variant, tuple(stat_names))
+    template = _template_ids.get(key)
+    if template is None:
+        template = CardTemplate(len(_templates), *key)
+        _templates.append(template)
+        _template_ids[key] = template
+    return template
+
+class Card:
+    """
+    A single card, stored compactly: a reference to its shared CardTemplate, its
+    serial number and its stats packed into a fixed-width byte string. With no
+    per-card dict and no repeated name/set/rarity strings, a card costs a fraction
+    of the collections.json dict it is loaded from.
+
+    Cards are immutable. name, card_set, rarity, variant and stats read like the
+    plain attributes they replace; stats builds a new dict on each access, so hot
+    paths should use stat_values instead.
+    """
+
+    __slots__ = ("template", "serial_number", "packed_stats")
+
+    def __init__(self, name: str, card_set: str, rarity: str, serial_number: str, stats: dict, variant: str = None):
+        self.template = intern_template(name, card_set, rarity, variant, stats.keys())
+        self.serial_number = serial_number
+        self.packed_stats = self.template.stat_codec.pack(*stats.values())
+
+    @classmethod
+    def from_packed(cls, template: CardTemplate, serial_number: str, packed_stats: bytes) -> "Card":
+        """Build a card from already packed stats, e.g. a row of a NumPy "<i2" array."""
+        card = cls.__new__(cls)
+        card.template = template
+        card.serial_number = serial_number
+        card.packed_stats = packed_stats
+        return card
+
+    @property
+    def name(self) -> str:
+        return self.template.name
+
+    @property
+    def card_set(self) -> str:
+        return self.template.card_set
+
+    @property
+    def rarity(self) -> str:
+        return self.template.rarity
+
+    @property
+    def variant(self):
+        return self.template.variant
+
+    @property
+    def stat_values(self) -> tuple:
+        return self.template.stat_codec.unpack(self.packed_stats)
+
+    @property
+    def stats(self) -> dict:
+        return dict(zip(self.template.stat_names, self.stat_values))
+
+    def stat(self, name: str, default=None):
+        """Return one stat's value without building the whole stats dict."""
+        try:
+            i = self.template.stat_names.index(name)
+        except ValueError:
+            return default
+        return self.template.stat_codec.unpack(self.packed_stats)[i]
+
+    def stat_total(self) -> int:
+        return sum(self.stat_values)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Card":
+        """Build a card from the collections.json shape."""
+        return cls(data["name"], data["set"], data["rarity"], data["serial_number"], data["stats"],
+                   data.get("variant"))
+
+    def to_dict(self) -> dict:
+        """Convert back to the collections.json shape."""
+        data = {
+            "serial_number": self.serial_number,
+            "name": self.name,
+            "set": self.card_set,
+            "rarity": self.rarity,
+            "stats": self.stats
+        }
+        if self.variant is not None:
+            data["variant"] = self.variant
+        return data
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Card):
+            return NotImplemented
+        return (self.template is other.template and self.serial_number == other.serial_number
+                and self.packed_stats == other.packed_stats)
+
+    def __hash__(self) -> int:
+        return hash(self.serial_number)
+
+    def __repr__(self) -> str:
+        return f"Card({self.serial_number!r}, {self.name!r}, {self.rarity!r})"
+
+    def __str__(self) -> str:
+        stats_str = "\n".join(f"- {stat}: {value}" for stat, value in self.stats.items())
+        return (
+            f"**Name:** {self.name}\n"
+            f"**Set:** {self.card_set}\n"
+            f"**Rarity:** {self.rarity}\n"
+            f"**Serial Number:** {self.serial_number}\n"
+            f"**Stats:**\n{stats_str}"
+        )
+
+def card_to_dict(card) -> dict:
+    """Return a card in the collections.json shape, whether it is a Card or already a dict."""
+    return card if isinstance(card, dict) else card.to_dict()
+
+def compact_collections(collections: dict) -> dict:
+    """
+    Replace every card dict in a user_id -> cards mapping with a Card, in place (so
+    anything else holding the mapping sees the compact cards too). Returns the mapping.
+    """
+    for user_key, user_cards in collections.items():
+        collections[user_key] = [
+            card if isinstance(card, Card) else Card.from_dict(card) for card in user_cards
+        ]
+    return collections
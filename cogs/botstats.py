@@ -0,0 +1,138 @@
+import io
+import time
+import discord
+from discord import app_commands
+from discord.ext import commands
+import metrics
+import profiler
+from cogs.drop import MY_USER_ID
+
+# Discord's limit on the length of one embed field.
+FIELD_LIMIT = 1024
+
+def format_duration(seconds) -> str:
+    if seconds is None:
+        return "-"
+    if seconds == float("inf"):
+        return f"> {metrics.LATENCY_BUCKETS[-1]:g} s"
+    if seconds < 1:
+        return f"{seconds * 1000:.3g} ms"
+    return f"{seconds:.3g} s"
+
+def format_bytes(count: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024 or unit == "GB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+
+def field_value(lines: list) -> str:
+    """Join lines for an embed field, dropping whole lines past Discord's limit."""
+    value = ""
+    for line in lines:
+        if len(value) + len(line) + 1 > FIELD_LIMIT:
+            break
+        value += line + "\n"
+    return value or "Nothing recorded yet."
+
+class BotStatsCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    @app_commands.command(name="botstats", description="Show the bot's performance metrics (owner only).")
+    async def botstats(self, interaction: discord.Interaction):
+        if interaction.user.id != MY_USER_ID:
+            await interaction.response.send_message("You are not authorized to view bot statistics.", ephemeral=True)
+            return
+        if not metrics.METRICS_ENABLED:
+            await interaction.response.send_message("Metrics are turned off (METRICS=0).", ephemeral=True)
+            return
+
+        # Latencies are histogram bucket bounds: "p95 50 ms" means 95% took at most 50 ms.
+        embed = discord.Embed(title="Bot Stats", color=0x95a5a6)
+        commands_lines = []
+        for (command,) in sorted(metrics.command_duration.keys()):
+            duration = metrics.command_duration
+            line = (f"**{command}**: {duration.count(command)}, p50 {format_duration(duration.quantile(0.5, command))}, "
+                    f"p95 {format_duration(duration.quantile(0.95, command))}")
+            errors = metrics.command_errors.get(command)
+            if errors:
+                line += f", {errors} errors"
+            commands_lines.append(line)
+        embed.add_field(name="Commands", value=field_value(commands_lines), inline=False)
+
+        render_lines = [
+            f"**{profile}**: {metrics.render_duration.count(profile)}, "
+            f"p95 {format_duration(metrics.render_duration.quantile(0.95, profile))}"
+            for (profile,) in sorted(metrics.render_duration.keys())
+        ]
+        phases = [f"{phase} {format_duration(metrics.render_phase.mean(phase))}"
+                  for phase in ("load", "composite", "text", "encode") if metrics.render_phase.count(phase)]
+        if phases:
+            render_lines.append("Mean per render: " + ", ".join(phases))
+        fallbacks = [f"{reason} {count}" for (reason,), count in sorted(metrics.render_fallbacks.snapshot().items())]
+        if fallbacks:
+            render_lines.append("Without image: " + ", ".join(fallbacks))
+        embed.add_field(name="Rendering", value=field_value(render_lines), inline=False)
+
+        storage_lines = [
+            f"**{backend} {operation}**: {metrics.storage_duration.count(backend, operation)}, "
+            f"mean {format_duration(metrics.storage_duration.mean(backend, operation))}"
+            for backend, operation in sorted(metrics.storage_duration.keys())
+        ]
+        storage_lines += [
+            f"**serials ({kind})**: {metrics.serial_allocation.count(kind)}, "
+            f"mean {format_duration(metrics.serial_allocation.mean(kind))}"
+            for (kind,) in sorted(metrics.serial_allocation.keys())
+        ]
+        transferred = [f"{direction} {format_bytes(count)}"
+                       for (direction,), count in sorted(metrics.storage_bytes.snapshot().items())]
+        if transferred:
+            storage_lines.append("Files: " + ", ".join(transferred))
+        embed.add_field(name="Storage", value=field_value(storage_lines), inline=False)
+
+        cache_lines = [
+            f"**{name}**: {hits}/{hits + misses}" + (f" ({rate:.0%})" if rate is not None else "")
+            for name, (hits, misses, rate) in sorted(metrics.cache_hit_rates().items())
+        ]
+        embed.add_field(name="Cache hits", value=field_value(cache_lines), inline=True)
+
+        lag = metrics.loop_lag
+        embed.add_field(
+            name="Event loop lag",
+            value=f"p50 {format_duration(lag.quantile(0.5))}\np99 {format_duration(lag.quantile(0.99))}",
+            inline=True
+        )
+
+        footer = f"Up {(time.time() - metrics.STARTED) / 3600:.1f} h"
+        peak = metrics.peak_memory_mb()
+        if peak is not None:
+            footer += f", peak memory {peak:.0f} MB"
+        embed.set_footer(text=footer)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="profile", description="Profile the running bot for a while (owner only).")
+    @app_commands.describe(seconds=f"How long to sample for (at most {profiler.PROFILE_MAX_SECONDS})")
+    async def profile(self, interaction: discord.Interaction, seconds: int = 30):
+        if interaction.user.id != MY_USER_ID:
+            await interaction.response.send_message("You are not authorized to profile the bot.", ephemeral=True)
+            return
+        if profiler.is_running():
+            await interaction.response.send_message("A profile is already running.", ephemeral=True)
+            return
+
+        seconds = min(max(seconds, 1), profiler.PROFILE_MAX_SECONDS)
+        # The profile outlasts the interaction response window.
+        await interaction.response.defer(ephemeral=True)
+        folded, sampler = await profiler.profile(seconds)
+
+        summary = f"{sampler.samples} samples over {seconds}s. Open the file in speedscope.app or flamegraph.pl."
+        hottest = profiler.hottest_frames(sampler)
+        if hottest:
+            summary += "\nBusiest in the event loop thread:\n" + "\n".join(
+                f"- {share:.0%} {label}" for label, share in hottest
+            )
+        file = discord.File(io.BytesIO(folded.encode("utf-8")), filename=f"profile-{int(time.time())}.folded")
+        await interaction.followup.send(summary, file=file, ephemeral=True)
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(BotStatsCog(bot))
@@ -1,22 +1,32 @@
+import os
+import asyncio
 import discord
 from discord import app_commands
 from discord.ext import commands
-from responses import generate_card, add_card_to_collection
-from imgen import generate_card_image
+from responses import generate_cards, add_card_to_collection
+from render_service import render_card, render_service, check_profile
+from metrics import timed
 
 MY_USER_ID = 239033440857489410
 
-# This ClaimView can either be moved to a shared file if reused elsewhere.
-class ClaimView(discord.ui.View):
-    def __init__(self, card, dropper_id, image_path):
-        super().__init__(timeout=60)  # View times out after 60 seconds.
+# Discord allows at most 10 embeds and 10 attachments per message.
+CARDS_PER_MESSAGE = 10
+
+# Output profile for dropped card images (see imgen.OUTPUT_PROFILES); lossy WebP
+# encodes quickly and uploads a fraction of the PNG size.
+DROP_IMAGE_PROFILE = check_profile("DROP_IMAGE_PROFILE", os.getenv("DROP_IMAGE_PROFILE", "webp"))
+
+class ClaimButton(discord.ui.Button):
+    """Claims one card out of a drop message."""
+
+    def __init__(self, card, number: int, single: bool):
+        super().__init__(label="Claim Card" if single else f"Claim #{number}", style=discord.ButtonStyle.green)
         self.card = card
-        self.dropper_id = dropper_id
-        self.image_path = image_path
+        self.number = number
         self.claimed = False
 
-    @discord.ui.button(label="Claim Card", style=discord.ButtonStyle.green)
-    async def claim_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+    @timed("claim")
+    async def callback(self, interaction: discord.Interaction):
         if self.claimed:
             await interaction.response.send_message("This card has already been claimed.", ephemeral=True)
             return
@@ -27,11 +37,40 @@ class ClaimView(discord.ui.View):
         # Get the card's serial number; adjust as needed if card is an object.
         serial_number = self.card.get("serial_number") if isinstance(self.card, dict) else getattr(self.card, "serial_number", "Unknown")
 
-        # Delete the original drop message.
-        await interaction.message.delete()
+        if self.view.all_claimed():
+            # Delete the original drop message once nothing is left to claim.
+            await interaction.message.delete()
+        else:
+            self.disabled = True
+            self.label = f"#{self.number} Claimed"
+            await interaction.response.edit_message(view=self.view)
         # Announce the claim.
         await interaction.channel.send(f"{interaction.user.mention} has claimed {serial_number}!")
 
+# This ClaimView can either be moved to a shared file if reused elsewhere.
+class ClaimView(discord.ui.View):
+    def __init__(self, cards: list, dropper_id: int, first_number: int = 1):
+        super().__init__(timeout=60)  # View times out after 60 seconds.
+        self.cards = cards
+        self.dropper_id = dropper_id
+        for offset, card in enumerate(cards):
+            self.add_item(ClaimButton(card, first_number + offset, single=len(cards) == 1))
+
+    def all_claimed(self) -> bool:
+        return all(item.claimed for item in self.children if isinstance(item, ClaimButton))
+
+def build_drop_embed(card, number: int, image_stream, single: bool) -> discord.Embed:
+    if single:
+        description = "A new card has been dropped! Click the **Claim Card** button to add it to your collection."
+    else:
+        description = f"Card **#{number}** has been dropped! Click **Claim #{number}** to add it to your collection."
+    if not image_stream:
+        description += f"\nImage generation failed.\n{card}"
+    embed = discord.Embed(title="Card Drop!", description=description, color=0x3498db)
+    if image_stream:
+        embed.set_image(url="attachment://" + image_stream.name)
+    return embed
+
 class DropCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -40,6 +79,7 @@ class DropCog(commands.Cog):
         name="drop",
         description="Drop a Blue Lock card; optionally specify a number of cards to drop (default is 1)."
     )
+    @timed("drop")
     async def drop(self, interaction: discord.Interaction, count: int = 1):
         if interaction.user.id != MY_USER_ID:
             await interaction.response.send_message("You are not authorized to drop a card.", ephemeral=True)
@@ -47,31 +87,34 @@ class DropCog(commands.Cog):
 
         count = max(count, 1)
 
-        for i in range(count):
-            card = generate_card()
-            image_stream = generate_card_image(card)
-
-            embed = discord.Embed(
-                title="Card Drop!",
-                description="A new card has been dropped! Click the **Claim Card** button to add it to your collection.",
-                color=0x3498db
-            )
-            if image_stream:
-                embed.set_image(url="attachment://" + image_stream.name)
-
-            view = ClaimView(card, interaction.user.id, image_stream)
-
-            # Use the initial response for the first card and followup for additional drops.
-            if i == 0:
-                if image_stream:
-                    await interaction.response.send_message(embed=embed, view=view, file=discord.File(image_stream))
-                else:
-                    await interaction.response.send_message(f"You dropped a card, but image generation failed.\n{card}", view=view)
-            else:
-                if image_stream:
-                    await interaction.followup.send(embed=embed, view=view, file=discord.File(image_stream))
-                else:
-                    await interaction.followup.send(f"You dropped a card, but image generation failed.\n{card}", view=view)
+        # Rendering happens in the worker pool and may take longer than the
+        # interaction response window, so acknowledge the command first.
+        await interaction.response.defer()
+
+        # Generate every card up front and render them concurrently, at most one per
+        # worker at a time so a big drop doesn't overflow the render queue and lose images.
+        cards = generate_cards(count)
+        renders = asyncio.Semaphore(render_service.workers)
+
+        async def render(card):
+            async with renders:
+                return await render_card(card, DROP_IMAGE_PROFILE)
+        image_streams = await asyncio.gather(*(render(card) for card in cards))
+
+        # Pack as many cards as Discord allows into each message.
+        single = count == 1
+        for start in range(0, count, CARDS_PER_MESSAGE):
+            chunk = cards[start:start + CARDS_PER_MESSAGE]
+            streams = image_streams[start:start + CARDS_PER_MESSAGE]
+            embeds = [
+                build_drop_embed(card, start + offset + 1, stream, single)
+                for offset, (card, stream) in enumerate(zip(chunk, streams))
+            ]
+            files = [discord.File(stream) for stream in streams if stream]
+            view = ClaimView(chunk, interaction.user.id, first_number=start + 1)
+
+            # The deferred response is completed by the first followup.
+            await interaction.followup.send(embeds=embeds, files=files, view=view)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(DropCog(bot))
@@ -0,0 +1,107 @@
+import asyncio
+import discord
+from discord import app_commands
+from discord.ext import commands
+from card_database import RARITY_CODES, SET_CODES
+from collection_index import RARITY_RANK
+from responses import get_collection_stats, load_indexes
+from cogs.search import indexes_pending
+from metrics import timed
+
+BOARD_CHOICES = (
+    [
+        app_commands.Choice(name="Most cards", value="cards"),
+        app_commands.Choice(name="Strongest card", value="strongest")
+    ]
+    + [app_commands.Choice(name=f"Most {rarity} cards", value=f"rarity:{rarity}") for rarity in RARITY_CODES]
+    + [app_commands.Choice(name=f"{card_set} completion", value=f"set:{card_set}") for card_set in SET_CODES]
+)
+
+def format_completion(owned: int, total: int) -> str:
+    if total == 0:
+        return "no cards yet"
+    return f"{owned}/{total} ({owned * 100 // total}%)"
+
+class LeaderboardCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.warmup = None
+
+    async def cog_load(self):
+        # Compute the statistics once the bot is up rather than on the first command, on a
+        # worker thread and in the same pass as the search index.
+        self.warmup = asyncio.create_task(self.build_stats())
+
+    async def cog_unload(self):
+        self.warmup.cancel()
+
+    async def build_stats(self):
+        await self.bot.wait_until_ready()
+        await load_indexes()
+
+    @app_commands.command(name="leaderboard", description="Show the top collectors.")
+    @app_commands.describe(board="What to rank collectors by")
+    @app_commands.choices(board=BOARD_CHOICES)
+    @timed("leaderboard")
+    async def leaderboard(self, interaction: discord.Interaction, board: str = "cards"):
+        if await indexes_pending(interaction):
+            return
+        stats = get_collection_stats()
+        entries = stats.leaderboard(board)
+        if not entries:
+            await interaction.response.send_message("Nobody is on this leaderboard yet.", ephemeral=True)
+            return
+
+        kind, _, subject = board.partition(":")
+        total = len(stats.catalog.get(subject, ())) if kind == "set" else None
+        description = ""
+        for rank, (value, user_key) in enumerate(entries, start=1):
+            if kind == "set":
+                shown = format_completion(value, total)
+            elif kind == "strongest":
+                shown = f"{value} ({stats.user(user_key).best_serial})"
+            else:
+                shown = f"{value} cards"
+            description += f"**{rank}.** <@{user_key}> - {shown}\n"
+
+        title = next(choice.name for choice in BOARD_CHOICES if choice.value == board)
+        embed = discord.Embed(title=f"Leaderboard: {title}", description=description, color=0xf1c40f)
+        await interaction.response.send_message(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+
+    @app_commands.command(name="stats", description="Show collection statistics for you or another collector.")
+    @app_commands.describe(user="Whose collection to describe (default: yours)")
+    @timed("stats")
+    async def stats(self, interaction: discord.Interaction, user: discord.User = None):
+        user = user or interaction.user
+        if await indexes_pending(interaction):
+            return
+        stats = get_collection_stats()
+        user_stats = stats.user(str(user.id))
+
+        embed = discord.Embed(title=f"Collection Stats: {user.display_name}", color=0x2ecc71)
+        if user_stats is None:
+            embed.description = "No cards yet."
+        else:
+            embed.description = f"**Cards:** {user_stats.card_count}"
+            if user_stats.best_serial is not None:
+                embed.description += f"\n**Strongest card:** {user_stats.best_serial} (stat total {user_stats.best_total})"
+            embed.add_field(
+                name="By rarity",
+                value="\n".join(f"{rarity}: {count}" for rarity, count in sorted(
+                    user_stats.rarity_counts.items(), key=lambda item: -RARITY_RANK.get(item[0], -1)
+                )),
+                inline=True
+            )
+            embed.add_field(
+                name="Set completion",
+                value="\n".join(
+                    f"{card_set}: {format_completion(len(user_stats.owned.get(card_set, ())), len(cards))}"
+                    for card_set, cards in stats.catalog.items()
+                ),
+                inline=True
+            )
+        embed.set_footer(text=f"{stats.total_cards} cards claimed by {len(stats.users)} collectors")
+        await interaction.response.send_message(embed=embed)
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(LeaderboardCog(bot))
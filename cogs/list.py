@@ -1,52 +1,72 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-from responses import get_user_cards
+from card_database import RARITY_CODES, SET_CODES
+from responses import get_user_cards, get_user_index
+from metrics import timed
+
+PAGE_SIZE = 10
+
+SORT_CHOICES = [
+    app_commands.Choice(name="Oldest first", value="acquired"),
+    app_commands.Choice(name="Newest first", value="newest"),
+    app_commands.Choice(name="Highest stat total", value="stat_total"),
+    app_commands.Choice(name="Rarest first", value="rarity"),
+    app_commands.Choice(name="Name", value="name")
+]
 
 class ListNavigationView(discord.ui.View):
-    def __init__(self, user_id: int, initial_page: int = 1):
+    def __init__(self, user_id: int, initial_page: int = 1, filters: dict = None, sort: str = "acquired"):
         super().__init__(timeout=60)
         self.user_id = user_id
-        self.page = initial_page
+        self.filters = filters or {}
+        self.sort = sort
+        self.page = max(initial_page, 1)
+        # Cursor each page starts after, so pages stay stable while new cards are claimed.
+        self.page_cursors = {}
+        self.load_page()
+
+    def load_page(self):
+        # Fetch the current page once; the buttons and the embed both use the result.
+        index = get_user_index(self.user_id)
+        if self.page in self.page_cursors:
+            self.page_cards, self.next_cursor = index.page(
+                self.filters, self.sort, after=self.page_cursors[self.page], limit=PAGE_SIZE
+            )
+        else:
+            self.page_cards, self.next_cursor = index.page(
+                self.filters, self.sort, offset=(self.page - 1) * PAGE_SIZE, limit=PAGE_SIZE
+            )
+        if self.next_cursor is not None:
+            self.page_cursors[self.page + 1] = self.next_cursor
         self.update_button_states()
 
     def update_button_states(self):
-        # Disable the Previous button if on the first page.
-        if self.page <= 1:
-            self.previous_page.disabled = True
-        else:
-            self.previous_page.disabled = False
-
-        # Check if there is a next page by comparing against the user_cards count.
-        user_cards = get_user_cards(self.user_id)
-        max_page = ((len(user_cards) - 1) // 10 + 1) if user_cards else 1
-        if self.page >= max_page:
-            self.next_page.disabled = True
-        else:
-            self.next_page.disabled = False
+        # Disable the Previous button if on the first page, and Next if on the last one.
+        self.previous_page.disabled = self.page <= 1
+        self.next_page.disabled = self.next_cursor is None
 
     def generate_embed(self) -> discord.Embed:
-        user_cards = get_user_cards(self.user_id)
-        start = (self.page - 1) * 10
-        end = start + 10
-
-        # Create description for the embed.
-        if not user_cards or start >= len(user_cards):
-            description = "No cards on this page. Please check your page number."
+        # Create description for the embed. Numbers are collection indexes usable with /show.
+        if not self.page_cards:
+            description = "No cards on this page. Please check your page number and filters."
         else:
-            page_cards = user_cards[start:end]
             description = ""
-            for idx, card in enumerate(page_cards, start=start + 1):
-                description += f"**{idx}.** {card['serial_number']} ({card['name']})\n"
+            for pos, card in self.page_cards:
+                description += f"**{pos + 1}.** {card.serial_number} ({card.name})\n"
 
         embed = discord.Embed(
             title=f"Your Cards (Page {self.page})",
             description=description,
             color=0x1abc9c
         )
+        active_filters = [f"{field}: {value}" for field, value in self.filters.items() if value is not None]
+        if active_filters or self.sort != "acquired":
+            embed.set_footer(text=" | ".join(active_filters + [f"sort: {self.sort}"]))
         return embed
 
     @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    @timed("list page")
     async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Only let the original user interact.
         if interaction.user.id != self.user_id:
@@ -55,11 +75,12 @@ class ListNavigationView(discord.ui.View):
 
         # Decrement the page number.
         self.page = max(1, self.page - 1)
-        self.update_button_states()
+        self.load_page()
         embed = self.generate_embed()
         await interaction.response.edit_message(embed=embed, view=self)
 
     @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    @timed("list page")
     async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Only let the original user interact.
         if interaction.user.id != self.user_id:
@@ -68,7 +89,7 @@ class ListNavigationView(discord.ui.View):
 
         # Increment the page number.
         self.page += 1
-        self.update_button_states()
+        self.load_page()
         embed = self.generate_embed()
         await interaction.response.edit_message(embed=embed, view=self)
 
@@ -81,13 +102,32 @@ class ListCog(commands.Cog):
         name="list",
         description="List your cards in your collection, 10 per page with navigation."
     )
-    async def list(self, interaction: discord.Interaction, page: int = 1):
+    @app_commands.rename(card_set="set")
+    @app_commands.describe(
+        rarity="Only show cards of this rarity",
+        card_set="Only show cards from this set",
+        character="Only show cards of this character",
+        sort="Order to list the cards in"
+    )
+    @app_commands.choices(
+        rarity=[app_commands.Choice(name=rarity, value=rarity) for rarity in RARITY_CODES],
+        card_set=[app_commands.Choice(name=card_set, value=card_set) for card_set in SET_CODES],
+        sort=SORT_CHOICES
+    )
+    @timed("list")
+    async def list(self, interaction: discord.Interaction, page: int = 1, rarity: str = None,
+                   card_set: str = None, character: str = None, sort: str = "acquired"):
         user_cards = get_user_cards(interaction.user.id)
         if not user_cards:
             await interaction.response.send_message("You have no card!", ephemeral=True)
             return
 
-        view = ListNavigationView(interaction.user.id, page)
+        if character is not None:
+            # Accept any capitalisation of a character the user owns.
+            character = get_user_index(interaction.user.id).resolve("character", character) or character
+        filters = {"rarity": rarity, "set": card_set, "character": character}
+
+        view = ListNavigationView(interaction.user.id, page, filters, sort)
         embed = view.generate_embed()
         await interaction.response.send_message(embed=embed, view=view)
 
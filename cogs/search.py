@@ -0,0 +1,80 @@
+import asyncio
+import discord
+from discord import app_commands
+from discord.ext import commands
+from responses import get_search_index, load_indexes, indexes_ready
+from metrics import timed
+
+async def indexes_pending(interaction: discord.Interaction) -> bool:
+    """
+    If the search index and statistics are still being built, say so (privately) and
+    return True. The first build can outlast the interaction response window, and
+    deferring would make the command's private replies public.
+    """
+    if indexes_ready():
+        return False
+    asyncio.ensure_future(load_indexes())  # In case the warmup hasn't started it.
+    await interaction.response.send_message("Still indexing every collection; try again in a moment.",
+                                            ephemeral=True)
+    return True
+
+class SearchCog(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.warmup = None
+
+    async def cog_load(self):
+        # Build the index once the bot is up, on a worker thread and in the same pass as the
+        # leaderboard statistics, so it neither delays startup nor blocks the event loop.
+        self.warmup = asyncio.create_task(self.build_index())
+
+    async def cog_unload(self):
+        self.warmup.cancel()
+
+    async def build_index(self):
+        await self.bot.wait_until_ready()
+        await load_indexes()
+
+    @app_commands.command(
+        name="search",
+        description="Search cards, e.g. 'isagi rarity:legendary shoot>=90' or 'serial:ICHI-CM'."
+    )
+    @app_commands.describe(
+        query="Words, field:word (name, set, rarity, variant), serial:PREFIX or stat ranges like shoot>=90",
+        everyone="Search every collector's cards instead of only yours"
+    )
+    @timed("search")
+    async def search(self, interaction: discord.Interaction, query: str, everyone: bool = False):
+        owner = None if everyone else str(interaction.user.id)
+        if await indexes_pending(interaction):
+            return
+        try:
+            total, matches = get_search_index().search(query, owner=owner)
+        except ValueError as e:
+            await interaction.response.send_message(str(e), ephemeral=True)
+            return
+
+        if not matches:
+            await interaction.response.send_message("No cards matched your search.", ephemeral=True)
+            return
+
+        # Numbers are collection indexes usable with /show by the card's owner.
+        description = ""
+        for user_key, pos, serial_number, name in matches:
+            line = f"**{pos + 1}.** {serial_number} ({name})"
+            if everyone:
+                line += f" - <@{user_key}>"
+            description += line + "\n"
+        if total > len(matches):
+            description += f"...and {total - len(matches)} more. Narrow your search to see them."
+
+        embed = discord.Embed(
+            title=f"Search Results ({total})",
+            description=description,
+            color=0x9b59b6
+        )
+        embed.set_footer(text=query)
+        await interaction.response.send_message(embed=embed)
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(SearchCog(bot))
@@ -1,9 +1,15 @@
+import os
 import discord
 from discord import app_commands
 from discord.ext import commands
-from types import SimpleNamespace
 from responses import get_user_cards
-from imgen import generate_card_image
+from render_service import render_card, check_profile
+from render_cache import card_cache_key
+from attachment_cache import attachment_cache
+from metrics import timed
+
+# Output profile for /show images (see imgen.OUTPUT_PROFILES); full quality by default.
+SHOW_IMAGE_PROFILE = check_profile("SHOW_IMAGE_PROFILE", os.getenv("SHOW_IMAGE_PROFILE", "full"))
 
 class ShowCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -13,6 +19,7 @@ class ShowCog(commands.Cog):
         name="show",
         description="Show a specific card from your collection by its list index (with image)."
     )
+    @timed("show")
     async def show(self, interaction: discord.Interaction, index: int):
         user_cards = get_user_cards(interaction.user.id)
         if not user_cards or index < 1 or index > len(user_cards):
@@ -20,22 +27,15 @@ class ShowCog(commands.Cog):
             return
 
         card = user_cards[index - 1]
-        # Convert the dict to an object with proper attributes expected by generate_card_image.
-        card_obj = SimpleNamespace(
-            name=card["name"],
-            card_set=card["set"],  # Adjust this if needed.
-            rarity=card["rarity"],
-            serial_number=card["serial_number"],
-            stats=card["stats"]
-        )
-        image_stream = generate_card_image(card_obj)
+        # Checking a previous upload or rendering may take a moment; acknowledge the command first.
+        await interaction.response.defer()
 
-        stats_str = "\n".join([f"- {stat}: {value}" for stat, value in card.get("stats", {}).items()])
+        stats_str = "\n".join([f"- {stat}: {value}" for stat, value in card.stats.items()])
         embed = discord.Embed(
-            title=f"{card['name']}",
+            title=f"{card.name}",
             description=(
-                f"**Rarity:** {card['rarity']}\n"
-                f"**Serial Number:** {card['serial_number']}\n"
+                f"**Rarity:** {card.rarity}\n"
+                f"**Serial Number:** {card.serial_number}\n"
                 f"**Stats:**\n{stats_str}"
             ),
             color=0xe74c3c
@@ -43,14 +43,28 @@ class ShowCog(commands.Cog):
 
         # Add author info
         embed.set_author(
-            name=f"{card['set']}\n"
+            name=f"{card.card_set}\n"
         )
 
+        # Point at the image uploaded by an earlier show of this card. Discord accepts any
+        # image URL without fetching it, so lookup's HEAD check is the only guard against
+        # an upload that has since expired or been deleted.
+        cache_key = card_cache_key(card, SHOW_IMAGE_PROFILE)
+        image_url = await attachment_cache.lookup(cache_key)
+        if image_url:
+            embed.set_image(url=image_url)
+            await interaction.followup.send(embed=embed)
+            return
+
+        # Render (repeat shows come from the render cache) and upload the image.
+        image_stream = await render_card(card, SHOW_IMAGE_PROFILE, cache=True)
         if image_stream:
             embed.set_image(url="attachment://" + image_stream.name)
-            await interaction.response.send_message(embed=embed, file=discord.File(image_stream))
+            message = await interaction.followup.send(embed=embed, file=discord.File(image_stream))
+            attachment_cache.record_message(message, {image_stream.name: cache_key})
         else:
-            await interaction.response.send_message(embed=embed)
+            embed.set_image(url=None)
+            await interaction.followup.send(embed=embed)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(ShowCog(bot))
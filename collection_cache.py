@@ -0,0 +1,59 @@
+import os
+from collections import OrderedDict
+from card_model import Card
+
+# Most users whose collections are kept in memory at once.
+COLLECTION_CACHE_USERS = int(os.getenv("COLLECTION_CACHE_USERS", "10000"))
+
+class UserCollectionCache:
+    """
+    The live user_id -> list of Cards mapping, loaded one user at a time.
+
+    A user's cards are read from the store the first time they are needed and
+    kept in an LRU of the most recently used users. Cards are only ever appended
+    to a user's list and every new card is handed to the store, so an evicted
+    user is simply read back on their next access (the store also returns cards
+    it has queued but not yet written). on_evict callbacks let anything built on
+    a user's list (e.g. the /list index) drop it along with the list.
+    """
+
+    def __init__(self, store, max_users: int = COLLECTION_CACHE_USERS):
+        self.store = store
+        self.max_users = max(max_users, 1)
+        self.users = OrderedDict()  # user_id -> list of Cards, least recently used first
+        self.on_evict = []
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, user_key: str) -> list:
+        """Return the user's live card list (empty, but still cached, if they have no cards)."""
+        cards = self.users.get(user_key)
+        if cards is not None:
+            self.users.move_to_end(user_key)
+            self.hits += 1
+            return cards
+        cards = [Card.from_dict(card) for card in self.store.load_user(user_key)]
+        self.loads += 1
+        self.users[user_key] = cards
+        while len(self.users) > self.max_users:
+            evicted, _ = self.users.popitem(last=False)
+            for callback in self.on_evict:
+                callback(evicted)
+        return cards
+
+    def peek(self, user_key: str):
+        """Return the user's card list if it is in memory, else None; never loads."""
+        return self.users.get(user_key)
+
+    def iter_all(self):
+        """
+        Yield (user_id, list of Cards) for every user with cards, streaming from the
+        store. Users already in memory yield their live list; others are not cached.
+        """
+        cached = dict(self.users)
+        for user_key, cards in self.store.iter_collections():
+            live = cached.pop(user_key, None)
+            yield user_key, live if live is not None else [Card.from_dict(card) for card in cards]
+        for user_key, cards in cached.items():
+            if cards:
+                yield user_key, cards
@@ -0,0 +1,107 @@
+import bisect
+from card_database import RARITY_CODES
+
+# Rarity rank used for sorting (Common is lowest).
+RARITY_RANK = {rarity: rank for rank, rarity in enumerate(RARITY_CODES)}
+
+# Fields /list can filter on: name -> how to read it from a card.
+FILTER_FIELDS = {
+    "rarity": lambda card: card.rarity,
+    "set": lambda card: card.card_set,
+    "character": lambda card: card.name
+}
+
+# Sort orders for /list: name -> sort key for (collection position, card); smaller comes first.
+SORT_KEYS = {
+    "acquired": lambda pos, card: pos,
+    "newest": lambda pos, card: -pos,
+    "stat_total": lambda pos, card: -card.stat_total(),
+    "rarity": lambda pos, card: -RARITY_RANK.get(card.rarity, -1),
+    "name": lambda pos, card: card.name.lower()
+}
+
+class UserCollectionIndex:
+    """
+    In-memory index over one user's card list.
+
+    Cards are only ever appended, so a card's position in the list (its /show index
+    minus one) never changes. The index keeps the positions of each rarity, set and
+    character, plus sorted views of (sort key, position) entries that are built on
+    first use and then kept up to date as cards are added. Page cursors are entries
+    from those views, so paging stays stable while new cards arrive.
+    """
+
+    def __init__(self, cards: list):
+        self.cards = cards  # The user's live card list, in acquisition order.
+        self.buckets = {field: {} for field in FILTER_FIELDS}  # field -> value -> positions
+        self.views = {}  # (field, value, sort) -> sorted entries; field None covers every card
+        self.indexed = 0
+        self.sync()
+
+    def sync(self) -> None:
+        """Index any cards appended to the list since the last call."""
+        for pos in range(self.indexed, len(self.cards)):
+            card = self.cards[pos]
+            for field, get_value in FILTER_FIELDS.items():
+                self.buckets[field].setdefault(get_value(card), []).append(pos)
+            for (field, value, sort), entries in self.views.items():
+                if field is None or FILTER_FIELDS[field](card) == value:
+                    bisect.insort(entries, (SORT_KEYS[sort](pos, card), pos))
+        self.indexed = len(self.cards)
+
+    def resolve(self, field: str, value: str):
+        """Return the stored spelling of a filter value (case-insensitive), or None."""
+        if value in self.buckets[field]:
+            return value
+        lowered = value.lower()
+        for known in self.buckets[field]:
+            if known.lower() == lowered:
+                return known
+        return None
+
+    def _view(self, field, value, sort: str) -> list:
+        key = (field, value, sort)
+        entries = self.views.get(key)
+        if entries is None:
+            positions = range(len(self.cards)) if field is None else self.buckets[field].get(value, [])
+            entries = sorted((SORT_KEYS[sort](pos, self.cards[pos]), pos) for pos in positions)
+            self.views[key] = entries
+        return entries
+
+    def page(self, filters: dict = None, sort: str = "acquired", after=None, offset: int = 0, limit: int = 10):
+        """
+        Return one page of cards as a list of (position, card) and the cursor for the
+        next page (None on the last page).
+
+        filters maps FILTER_FIELDS names to values (None means no filter). The page
+        starts right after the cursor `after` if given, otherwise `offset` cards in.
+        """
+        self.sync()
+        active = {field: value for field, value in (filters or {}).items() if value is not None}
+        if active:
+            # Walk the sorted view of the most selective filter and check the rest per card.
+            field = min(active, key=lambda f: len(self.buckets[f].get(active[f], ())))
+            entries = self._view(field, active[field], sort)
+            del active[field]
+        else:
+            entries = self._view(None, None, sort)
+
+        start = bisect.bisect_right(entries, after) if after is not None else 0
+        found = []
+        if not active:
+            found = entries[start + offset:start + offset + limit + 1]
+        else:
+            for i in range(start, len(entries)):
+                entry = entries[i]
+                card = self.cards[entry[1]]
+                if all(FILTER_FIELDS[f](card) == v for f, v in active.items()):
+                    if offset:
+                        offset -= 1
+                        continue
+                    found.append(entry)
+                    if len(found) > limit:
+                        break
+
+        # One extra entry was fetched to tell whether another page exists.
+        next_cursor = found[limit - 1] if len(found) > limit else None
+        return [(pos, self.cards[pos]) for _, pos in found[:limit]], next_cursor
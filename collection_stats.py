@@ -0,0 +1,140 @@
+import os
+from card_database import RARITY_CODES, SET_CODES, get_all_cards
+
+# Entries kept (and shown) per leaderboard.
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+
+def set_catalog() -> dict:
+    """Set name -> the distinct (name, rarity) cards currently droppable in it, for every set in SET_CODES."""
+    catalog = {card_set: set() for card_set in SET_CODES}
+    for template in get_all_cards():
+        catalog.setdefault(template["set"], set()).add((template["name"], template["rarity"]))
+    return catalog
+
+class TopK:
+    """
+    The k users with the highest value of one metric, best first.
+
+    Metrics only ever grow (cards are never removed), so a user can only enter
+    the board by passing its current last entry; updates are O(k) and reading
+    the board is O(1) regardless of how many users there are.
+    """
+
+    def __init__(self, k: int = LEADERBOARD_SIZE):
+        self.k = k
+        self.entries = []  # [value, user_key], highest first; ties keep who got there first
+
+    def update(self, user_key: str, value) -> None:
+        for entry in self.entries:
+            if entry[1] == user_key:
+                entry[0] = value
+                break
+        else:
+            if len(self.entries) >= self.k and value <= self.entries[-1][0]:
+                return
+            self.entries.append([value, user_key])
+        self.entries.sort(key=lambda entry: -entry[0])
+        del self.entries[self.k:]
+
+    def load(self, values: dict) -> None:
+        """Replace the board with the top k of a complete user_key -> value mapping."""
+        best = sorted(values.items(), key=lambda item: -item[1])[:self.k]
+        self.entries = [[value, user_key] for user_key, value in best if value > 0]
+
+class UserStats:
+    """Running totals for one collector."""
+
+    __slots__ = ("card_count", "rarity_counts", "best_total", "best_serial", "owned")
+
+    def __init__(self):
+        self.card_count = 0
+        self.rarity_counts = {}  # rarity -> cards
+        self.best_total = 0  # Highest stat total of any one card, and that card's serial.
+        self.best_serial = None
+        self.owned = {}  # set name -> distinct (name, rarity) cards owned
+
+class CollectionStats:
+    """
+    Aggregate statistics and leaderboards over every claimed card, for /stats and
+    /leaderboard.
+
+    add() updates the totals of the claiming user, the global totals and the
+    affected boards as each card is claimed, so nothing ever rescans collections;
+    build() computes everything from storage in one pass.
+
+    Boards: "cards" (collection size), "strongest" (best single-card stat total),
+    "rarity:<rarity>" (cards of that rarity) and "set:<set>" (distinct cards of
+    the set owned).
+    """
+
+    def __init__(self):
+        self.users = {}  # user_key -> UserStats
+        self.total_cards = 0
+        self.rarity_totals = {}
+        self.set_totals = {}
+        self.catalog = set_catalog()
+        self.boards = {"cards": TopK(), "strongest": TopK()}
+        for rarity in RARITY_CODES:
+            self.boards[f"rarity:{rarity}"] = TopK()
+        for card_set in self.catalog:
+            self.boards[f"set:{card_set}"] = TopK()
+
+    def _count(self, user_key: str, card) -> UserStats:
+        """Add one card to the totals, without touching the boards."""
+        user = self.users.get(user_key)
+        if user is None:
+            user = self.users[user_key] = UserStats()
+        user.card_count += 1
+        user.rarity_counts[card.rarity] = user.rarity_counts.get(card.rarity, 0) + 1
+        total = card.stat_total()
+        if total > user.best_total:
+            user.best_total, user.best_serial = total, card.serial_number
+        if (card.name, card.rarity) in self.catalog.get(card.card_set, ()):
+            user.owned.setdefault(card.card_set, set()).add((card.name, card.rarity))
+        self.total_cards += 1
+        self.rarity_totals[card.rarity] = self.rarity_totals.get(card.rarity, 0) + 1
+        self.set_totals[card.card_set] = self.set_totals.get(card.card_set, 0) + 1
+        return user
+
+    def add(self, user_key: str, card) -> None:
+        """Count a newly claimed card and update the boards it affects."""
+        user = self._count(user_key, card)
+        self.boards["cards"].update(user_key, user.card_count)
+        self.boards["strongest"].update(user_key, user.best_total)
+        board = self.boards.get(f"rarity:{card.rarity}")
+        if board is not None:
+            board.update(user_key, user.rarity_counts[card.rarity])
+        board = self.boards.get(f"set:{card.card_set}")
+        if board is not None and card.card_set in user.owned:
+            board.update(user_key, len(user.owned[card.card_set]))
+
+    def build(self, collections) -> None:
+        """Compute everything in one pass, given (user_key, cards) pairs such as collections.items()."""
+        for user_key, user_cards in collections:
+            self.extend(user_key, user_cards)
+        self.finish()
+
+    def extend(self, user_key: str, user_cards: list) -> None:
+        """Count one user's cards as part of a build; call finish() once every user is in."""
+        for card in user_cards:
+            self._count(user_key, card)
+
+    def finish(self) -> None:
+        """Fill the boards from the totals counted so far."""
+        users = self.users
+        self.boards["cards"].load({key: user.card_count for key, user in users.items()})
+        self.boards["strongest"].load({key: user.best_total for key, user in users.items()})
+        for name, board in self.boards.items():
+            kind, _, value = name.partition(":")
+            if kind == "rarity":
+                board.load({key: user.rarity_counts.get(value, 0) for key, user in users.items()})
+            elif kind == "set":
+                board.load({key: len(user.owned.get(value, ())) for key, user in users.items()})
+
+    def leaderboard(self, board: str) -> list:
+        """The board's [value, user_key] entries, best first."""
+        return self.boards[board].entries
+
+    def user(self, user_key: str):
+        """The user's totals, or None if they have no cards."""
+        return self.users.get(user_key)
@@ -1,5 +1,8 @@
 import os
 import io  # for BytesIO
+import time
+import threading
+from collections import OrderedDict
 from PIL import Image, ImageDraw, ImageFont
 
 # Directories for assets.
@@ -7,21 +10,27 @@ ASSET_DIR = "assets"
 BACKGROUND_DIR = os.path.join(ASSET_DIR, "backgrounds")
 CHARACTER_DIR = os.path.join(ASSET_DIR, "characters")
 
+# Maximum number of pre-composited base layers (background + character) kept in memory.
+# Each layer is a full-resolution RGBA image (~11 MB at 1349x2048), so keep this modest.
+BASE_CACHE_SIZE = int(os.getenv("CARD_BASE_CACHE_SIZE", "16"))
+
+# Background image for each rarity (lowercase); unknown rarities use the common one.
+BACKGROUND_RARITIES = {
+    "common": "common.png",
+    "uncommon": "uncommon.png",
+    "rare": "rare.png",
+    "epic": "epic.png",
+    "ultra rare": "ultrarare.png",
+    "legendary": "legendary.png",
+    "mythic": "mythic.png"
+}
+
 def get_background_path(rarity: str) -> str:
-    rarity = rarity.lower()
-    mapping = {
-        "common": "common.png",
-        "uncommon": "uncommon.png",
-        "rare": "rare.png",
-        "epic": "epic.png",
-        "ultra rare": "ultrarare.png",
-        "legendary": "legendary.png",
-        "mythic": "mythic.png"
-    }
-    file_name = mapping.get(rarity, "common.png")
+    file_name = BACKGROUND_RARITIES.get(rarity.lower(), "common.png")
     return os.path.join(BACKGROUND_DIR, file_name)
 
 from card_database import get_set_code, get_char_code
+from asset_bundle import open_bundle, layer_key
 
 def get_character_image_path(card_set: str, name: str, variant: str = None) -> str:
     set_code = get_set_code(card_set)
@@ -33,29 +42,32 @@ def get_character_image_path(card_set: str, name: str, variant: str = None) -> s
     file_name = f"{char_code}.png"
     return os.path.join(CHARACTER_DIR, set_code, file_name)
 
-def generate_card_image(card) -> io.BytesIO:
-    """
-    Composes an image for the given card and returns an in-memory BytesIO object.
-    The card object is expected to have these attributes:
-      - card.rarity
-      - card.card_set (human‑readable set name)
-      - card.name
-      - card.serial_number
-      - card.stats (a dictionary)
-    """
-    # Load the background image based on rarity.
-    bg_path = get_background_path(card.rarity)
+# --- Base layer cache ---
+
+# (background path, character path) -> composed RGBA image, in LRU order.
+_base_cache = OrderedDict()
+_base_cache_lock = threading.Lock()
+
+# The baked asset bundle (see asset_bundle.py): None until first use, False if there is none.
+_asset_bundle = None
+
+def get_asset_bundle():
+    """Return the memory-mapped asset bundle, opening it the first time, or None if none was baked."""
+    global _asset_bundle
+    if _asset_bundle is None:
+        with _base_cache_lock:
+            if _asset_bundle is None:
+                _asset_bundle = open_bundle() or False
+    return _asset_bundle or None
+
+def _compose_base_layer(bg_path: str, char_path: str):
+    """Load the background and character art and paste them into a single RGBA layer."""
     try:
         background = Image.open(bg_path).convert("RGBA")
     except Exception as e:
         print(f"Error loading background image: {e}")
         return None
 
-    bg_width, bg_height = background.size
-
-    # Load the character image.
-    variant = getattr(card, "variant", None)  # works if card is an object/dict that includes variant
-    char_path = get_character_image_path(card.card_set, card.name, variant)
     try:
         character = Image.open(char_path).convert("RGBA")
     except FileNotFoundError:
@@ -63,113 +75,369 @@ def generate_card_image(card) -> io.BytesIO:
         return None
 
     # Resize the character image to match the background size.
-    character = character.resize((bg_width, bg_height), Image.LANCZOS)
+    character = character.resize(background.size, Image.LANCZOS)
 
     # Compose the card image by pasting the character onto the background.
     background.paste(character, (0, 0), character)
+    return background
 
-    # Prepare to draw text.
-    draw = ImageDraw.Draw(background)
-    stroke_width = 4
-    stroke_fill = (0, 0, 0)  # Black outline
+def get_base_layer(rarity: str, card_set: str, name: str, variant: str = None):
+    """
+    Return the pre-composited background + character layer for a card template.
 
-    # Font for stat text (larger size).
-    try:
-        stats_font = ImageFont.truetype("arial.ttf", 60)
-    except IOError:
-        stats_font = ImageFont.load_default()
+    The returned image is shared by every render of the same template, so callers
+    must copy it before drawing on it. Layers in the asset bundle come straight from
+    its memory map; anything else is composed from the files and kept in an LRU.
+    Returns None if an asset is missing; failures are not cached so newly added art
+    is picked up on the next render.
+    """
+    key = (get_background_path(rarity), get_character_image_path(card_set, name, variant))
+    bundle = get_asset_bundle()
+    if bundle is not None:
+        base = bundle.layer(layer_key(*key))
+        if base is not None:
+            return base
+    with _base_cache_lock:
+        base = _base_cache.get(key)
+        if base is not None:
+            _base_cache.move_to_end(key)
+            return base
 
-    # Font for bold text for the stat value.
-    try:
-        bold_font = ImageFont.truetype("arialbd.ttf", 60)  # Arial Bold; adjust path if needed.
-    except IOError:
-        bold_font = ImageFont.load_default()
+    base = _compose_base_layer(*key)
+    if base is None:
+        return None
+
+    with _base_cache_lock:
+        _base_cache[key] = base
+        _base_cache.move_to_end(key)
+        while len(_base_cache) > BASE_CACHE_SIZE:
+            _base_cache.popitem(last=False)
+    return base
 
-    # Font for serial number (smaller size).
+def invalidate_base_layers(path: str = None) -> None:
+    """
+    Drop cached base layers after asset files change.
+
+    If path is given, only layers built from that background or character file are
+    dropped (including the asset bundle's); otherwise the whole cache is cleared and
+    the asset bundle is opened again on next use, in case it was baked again.
+    """
+    global _asset_bundle
+    with _base_cache_lock:
+        if path is None:
+            _base_cache.clear()
+            _asset_bundle = None
+            return
+        if _asset_bundle:
+            _asset_bundle.discard_source(path)
+        path = os.path.normpath(path)
+        for key in [k for k in _base_cache if path in (os.path.normpath(k[0]), os.path.normpath(k[1]))]:
+            del _base_cache[key]
+
+# --- Glyph atlas for stat and serial text ---
+
+# Characters pre-rasterized when an atlas is built; anything else is added on first use.
+ATLAS_CHARSET = " -0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+class GlyphAtlas:
+    """
+    Pre-rasterized glyphs for one font, size and stroke width.
+
+    Each glyph keeps two masks, drawn once with ImageDraw: the stroked outline and
+    the plain fill. Text is drawn by pasting every outline first and every fill
+    second, the same order ImageDraw.text uses for stroked text, so neighbouring
+    outlines never cover a glyph's fill. Glyphs are advanced by their own width;
+    kerning is not applied, which is invisible for the digits, capitals and dashes
+    printed on cards.
+    """
+
+    def __init__(self, font, stroke_width: int, charset: str = ATLAS_CHARSET):
+        self.font = font
+        self.stroke_width = stroke_width
+        self.glyphs = {}  # char -> (advance, bbox relative to the pen, outline mask, fill mask)
+        self.lock = threading.Lock()
+        for char in charset:
+            self._add_glyph(char)
+
+    def _add_glyph(self, char: str):
+        left, top, right, bottom = self.font.getbbox(char, stroke_width=self.stroke_width)
+        size = (max(right - left, 1), max(bottom - top, 1))
+        outline = Image.new("L", size, 0)
+        ImageDraw.Draw(outline).text(
+            (-left, -top), char, font=self.font, fill=255,
+            stroke_width=self.stroke_width, stroke_fill=255
+        )
+        fill = Image.new("L", size, 0)
+        ImageDraw.Draw(fill).text((-left, -top), char, font=self.font, fill=255)
+        glyph = (self.font.getlength(char), (left, top, right, bottom), outline, fill)
+        with self.lock:
+            self.glyphs[char] = glyph
+        return glyph
+
+    def _layout(self, text: str) -> list:
+        """Return (x offset from the start of the text, glyph) for each character."""
+        placed = []
+        pen = 0.0
+        for char in text:
+            glyph = self.glyphs.get(char) or self._add_glyph(char)
+            placed.append((int(pen), glyph))
+            pen += glyph[0]
+        return placed
+
+    def textbbox(self, xy: tuple, text: str) -> tuple:
+        """Bounding box of the stroked text drawn at xy, like ImageDraw.textbbox."""
+        placed = self._layout(text)
+        if not placed:
+            return (xy[0], xy[1], xy[0], xy[1])
+        return (
+            xy[0] + min(x + glyph[1][0] for x, glyph in placed),
+            xy[1] + min(glyph[1][1] for _, glyph in placed),
+            xy[0] + max(x + glyph[1][2] for x, glyph in placed),
+            xy[1] + max(glyph[1][3] for _, glyph in placed)
+        )
+
+    def draw(self, image, xy: tuple, text: str, fill, stroke_fill) -> None:
+        placed = self._layout(text)
+        for x, (_, bbox, outline, _) in placed:
+            image.paste(stroke_fill, (xy[0] + x + bbox[0], xy[1] + bbox[1]), outline)
+        for x, (_, bbox, _, glyph_fill) in placed:
+            image.paste(fill, (xy[0] + x + bbox[0], xy[1] + bbox[1]), glyph_fill)
+
+# --- Output profiles ---
+
+# Discord's dark theme background, used to fill transparent corners in formats without alpha.
+DEFAULT_MATTE = (49, 51, 56)
+
+# How a rendered card is encoded: name -> format, file extension, scale (1.0 is full
+# resolution) and Pillow save options. Call sites pick a profile per use.
+OUTPUT_PROFILES = {
+    # Full-quality PNG with Pillow's default compression (the original output).
+    "full": {"format": "PNG", "extension": "png", "scale": 1.0, "options": {}},
+    # Same pixels, about twice as fast to encode and slightly larger.
+    "fast_png": {"format": "PNG", "extension": "png", "scale": 1.0, "options": {"compress_level": 1}},
+    # Lossless WebP: same pixels, smaller than PNG and as fast as fast_png.
+    "webp_lossless": {"format": "WEBP", "extension": "webp", "scale": 1.0,
+                      "options": {"lossless": True, "method": 0, "quality": 0}},
+    # Lossy WebP: roughly a fifth of the PNG size; the default for drops.
+    "webp": {"format": "WEBP", "extension": "webp", "scale": 1.0, "options": {"quality": 85, "method": 2}},
+    # JPEG: fastest to encode; transparent areas are filled with the matte colour.
+    "jpeg": {"format": "JPEG", "extension": "jpg", "scale": 1.0, "options": {"quality": 90}},
+    # Quarter-size preview for lists and other small contexts.
+    "thumbnail": {"format": "WEBP", "extension": "webp", "scale": 0.25, "options": {"quality": 80}}
+}
+
+def encode_card_image(image, serial_number: str, profile: str = "full") -> io.BytesIO:
+    """Encode a composed card image with the given output profile into a named BytesIO."""
+    settings = OUTPUT_PROFILES.get(profile)
+    if settings is None:
+        raise ValueError(f"Unknown output profile: {profile}")
+
+    scale = settings["scale"]
+    if scale != 1.0:
+        size = (max(round(image.width * scale), 1), max(round(image.height * scale), 1))
+        image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    if settings["format"] == "JPEG":
+        flattened = Image.new("RGB", image.size, settings.get("matte", DEFAULT_MATTE))
+        flattened.paste(image, (0, 0), image)
+        image = flattened
+
+    output_stream = io.BytesIO()
+    image.save(output_stream, format=settings["format"], **settings["options"])
+    output_stream.seek(0)
+    # Set a name so that Discord recognizes the file type (this will be used in the attachment URL).
+    output_stream.name = f"{serial_number}.{settings['extension']}"
+    return output_stream
+
+# --- Render context: fonts and layout shared by every render ---
+
+# Fonts as (font file, size). Adjust the paths if the fonts live elsewhere.
+STATS_FONT = ("arial.ttf", 60)    # Stat abbreviations.
+BOLD_FONT = ("arialbd.ttf", 60)   # Stat values (Arial Bold).
+SERIAL_FONT = ("arial.ttf", 30)   # Serial number.
+
+STROKE_WIDTH = 4
+STROKE_FILL = (0, 0, 0)  # Black outline
+TEXT_FILL = (255, 255, 255)
+
+# Abbreviate stats to 3 letters.
+STAT_ABBREVIATIONS = {
+    "Offense": "OFF",
+    "Speed": "SPD",
+    "Defense": "DEF",
+    "Pass": "PAS",
+    "Dribble": "DRI",
+    "Shoot": "SHO"
+}
+
+# Stat positions on the card.
+STAT_POSITIONS = {
+    "Offense": (200, 400),
+    "Speed": (200, 480),
+    "Defense": (200, 560),
+    "Pass": (200, 640),
+    "Dribble": (200, 720),
+    "Shoot": (200, 800)
+}
+
+# Distance of the serial number above the bottom edge.
+SERIAL_BOTTOM_MARGIN = 250
+
+def load_font(font_file: str, size: int):
     try:
-        serial_font = ImageFont.truetype("arial.ttf", 30)
+        return ImageFont.truetype(font_file, size)
     except IOError:
-        serial_font = ImageFont.load_default()
-
-    # Abbreviate stats to 3 letters.
-    stat_abbreviations = {
-        "Offense": "OFF",
-        "Speed": "SPD",
-        "Defense": "DEF",
-        "Pass": "PAS",
-        "Dribble": "DRI",
-        "Shoot": "SHO"
-    }
-
-    # Define stat positions.
-    positions = {
-        "Offense": (200, 400),
-        "Speed": (200, 480),
-        "Defense": (200, 560),
-        "Pass": (200, 640),
-        "Dribble": (200, 720),
-        "Shoot": (200, 800)
-    }
+        return ImageFont.load_default()
+
+class TextRenderer:
+    """Draws stroked text with one font, from a glyph atlas when the font supports it."""
+
+    def __init__(self, font, stroke_width: int = STROKE_WIDTH):
+        self.font = font
+        self.stroke_width = stroke_width
+        # Bitmap fallback fonts can't be measured per glyph; draw those with ImageDraw.
+        self.atlas = GlyphAtlas(font, stroke_width) if isinstance(font, ImageFont.FreeTypeFont) else None
+
+    def textbbox(self, xy: tuple, text: str) -> tuple:
+        if self.atlas is not None:
+            return self.atlas.textbbox(xy, text)
+        return ImageDraw.Draw(Image.new("L", (1, 1))).textbbox(
+            xy, text, font=self.font, stroke_width=self.stroke_width
+        )
+
+    def draw(self, image, xy: tuple, text: str, fill=TEXT_FILL, stroke_fill=STROKE_FILL) -> None:
+        if self.atlas is not None:
+            self.atlas.draw(image, xy, text, fill, stroke_fill)
+        else:
+            ImageDraw.Draw(image).text(
+                xy, text, font=self.font, fill=fill,
+                stroke_width=self.stroke_width, stroke_fill=stroke_fill
+            )
+
+class RenderContext:
+    """
+    Fonts, glyph atlases and layout for card text, loaded once per process.
+
+    A context is never changed after it is built; reload_render_context() builds a
+    new one and swaps it in, so renders already running in other threads keep a
+    consistent set of fonts and positions.
+    """
+
+    def __init__(self, stats_font=STATS_FONT, bold_font=BOLD_FONT, serial_font=SERIAL_FONT,
+                 stroke_width: int = STROKE_WIDTH, abbreviations: dict = None, positions: dict = None):
+        self.stats_text = TextRenderer(load_font(*stats_font), stroke_width)
+        self.bold_text = TextRenderer(load_font(*bold_font), stroke_width)
+        self.serial_text = TextRenderer(load_font(*serial_font), stroke_width)
+        self.positions = dict(positions or STAT_POSITIONS)
+        abbreviations = abbreviations or STAT_ABBREVIATIONS
+        # Abbreviation labels, with a leading space between value and abbreviation.
+        self.labels = {stat: f" {abbr}" for stat, abbr in abbreviations.items()}
+        # Widths of the bold stat values drawn so far; stats only span a small range.
+        self.value_widths = {}
+
+    def stat_layout(self, stat: str) -> tuple:
+        """Return (position, label) for a stat; unknown stats go top-left."""
+        label = self.labels.get(stat)
+        if label is None:
+            label = f" {stat[:3].upper()}"
+        return self.positions.get(stat, (20, 20)), label
+
+    def value_width(self, value_text: str) -> int:
+        width = self.value_widths.get(value_text)
+        if width is None:
+            bbox = self.bold_text.textbbox((0, 0), value_text)
+            width = self.value_widths[value_text] = bbox[2] - bbox[0]
+        return width
+
+_render_context = None
+_render_context_lock = threading.Lock()
+
+def get_render_context() -> RenderContext:
+    """Return this process's render context, building it on first use."""
+    global _render_context
+    if _render_context is None:
+        with _render_context_lock:
+            if _render_context is None:
+                _render_context = RenderContext()
+    return _render_context
+
+def reload_render_context(**overrides) -> RenderContext:
+    """
+    Rebuild the render context after fonts or layout change. Keyword arguments
+    are passed to RenderContext (e.g. positions=...). Only affects this process;
+    RenderService.reload() restarts the render workers.
+    """
+    global _render_context
+    context = RenderContext(**overrides)
+    with _render_context_lock:
+        _render_context = context
+    return context
+
+def generate_card_image(card, context: RenderContext = None, profile: str = "full",
+                        timings: dict = None) -> io.BytesIO:
+    """
+    Composes an image for the given card and returns an in-memory BytesIO object,
+    encoded with the named output profile (see OUTPUT_PROFILES). If a timings dict
+    is given, the seconds spent loading the base layer, compositing, drawing text
+    and encoding are stored in it under "load", "composite", "text" and "encode".
+    The card object is expected to have these attributes:
+      - card.rarity
+      - card.card_set (human‑readable set name)
+      - card.name
+      - card.serial_number
+      - card.stats (a dictionary)
+    """
+    context = context or get_render_context()
+    if timings is not None:
+        started = time.perf_counter()
+
+    # Start from the cached background + character layer for this template.
+    variant = getattr(card, "variant", None)  # works if card is an object/dict that includes variant
+    base = get_base_layer(card.rarity, card.card_set, card.name, variant)
+    if base is None:
+        return None
+    if timings is not None:
+        timings["load"] = time.perf_counter() - started
+        started = time.perf_counter()
+
+    background = base.copy()
+    if timings is not None:
+        timings["composite"] = time.perf_counter() - started
+        started = time.perf_counter()
+    bg_width, bg_height = background.size
 
     # Draw each stat using its designated position with a text stroke.
     # Draw the stat value in bold and the abbreviation in the regular font.
     for stat, value in card.stats.items():
-        pos = positions.get(stat, (20, 20))  # Default position if stat not found in our mapping.
-        abbr = stat_abbreviations.get(stat, stat[:3].upper())
+        pos, abbr_text = context.stat_layout(stat)
         value_text = f"{value}"
-        abbr_text = f" {abbr}"  # add a leading space between value and abbreviation
 
         # Draw the bolded stat value.
-        draw.text(
-            pos,
-            value_text,
-            font=bold_font,
-            fill=(255, 255, 255),
-            stroke_width=stroke_width,
-            stroke_fill=stroke_fill
-        )
-
-        # Use textbbox to determine the width of the drawn bold text.
-        bbox = draw.textbbox(pos, value_text, font=bold_font, stroke_width=stroke_width)
-        value_width = bbox[2] - bbox[0]
+        context.bold_text.draw(background, pos, value_text)
 
-        # Calculate the position for the abbreviation.
-        abbr_pos = (pos[0] + value_width, pos[1])
+        # Place the abbreviation right after the drawn bold value.
+        abbr_pos = (pos[0] + context.value_width(value_text), pos[1])
 
         # Draw the abbreviation using the regular font.
-        draw.text(
-            abbr_pos,
-            abbr_text,
-            font=stats_font,
-            fill=(255, 255, 255),
-            stroke_width=stroke_width,
-            stroke_fill=stroke_fill
-        )
+        context.stats_text.draw(background, abbr_pos, abbr_text)
 
     # Prepare serial number text.
     serial_text = f"{card.serial_number}"
-    # Calculate text size for the serial number using textbbox.
-    bbox = draw.textbbox((0, 0), serial_text, font=serial_font, stroke_width=stroke_width)
+    # Calculate text size for the serial number from its bounding box.
+    bbox = context.serial_text.textbbox((0, 0), serial_text)
     text_width = bbox[2] - bbox[0]
     text_height = bbox[3] - bbox[1]
     # Center the serial number horizontally and position it near the bottom.
-    serial_pos = ((bg_width - text_width) // 2, (bg_height - text_height) - 250)
-    draw.text(
-        serial_pos,
-        serial_text,
-        font=serial_font,
-        fill=(255, 255, 255),
-        stroke_width=stroke_width,
-        stroke_fill=stroke_fill
-    )
+    serial_pos = ((bg_width - text_width) // 2, (bg_height - text_height) - SERIAL_BOTTOM_MARGIN)
+    context.serial_text.draw(background, serial_pos, serial_text)
+    if timings is not None:
+        timings["text"] = time.perf_counter() - started
+        started = time.perf_counter()
 
-    # Save the final composed image to a BytesIO stream instead of a disk file.
-    output_stream = io.BytesIO()
-    background.save(output_stream, format="PNG")
-    output_stream.seek(0)
-    # Set a name so that Discord recognizes the file type (this will be used in the attachment URL).
-    output_stream.name = f"{card.serial_number}.png"
-    return output_stream
+    # Encode the final composed image to a BytesIO stream instead of a disk file.
+    image_stream = encode_card_image(background, card.serial_number, profile)
+    if timings is not None:
+        timings["encode"] = time.perf_counter() - started
+    return image_stream
 
 # For testing imgen.py independently.
 if __name__ == "__main__":
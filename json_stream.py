@@ -0,0 +1,106 @@
+import re
+import json
+import codecs
+
+# Bytes read from the file at a time.
+READ_CHUNK = 1 << 20
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+class _Reader:
+    """A growing text buffer over a UTF-8 file that can map buffer positions to byte offsets."""
+
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.eof = False
+        # Byte offset of buf[0], and a (position, byte offset) pair inside buf to count forward from.
+        self.base = 0
+        self.mark = (0, 0)
+
+    def fill(self, keep_from: int) -> int:
+        """Drop buf[:keep_from], read more text and return keep_from's new position (0)."""
+        if self.eof:
+            return keep_from
+        self.base = self.offset(keep_from)
+        self.buf = self.buf[keep_from:]
+        self.mark = (0, self.base)
+        # Read at least as much as is buffered, so values spanning many chunks are not
+        # re-parsed from the start once per chunk.
+        data = self.f.read(max(self.chunk_size, len(self.buf)))
+        if not data:
+            self.eof = True
+            self.buf += self.decoder.decode(b"", final=True)
+        else:
+            self.buf += self.decoder.decode(data)
+        return 0
+
+    def offset(self, pos: int) -> int:
+        """Byte offset in the file of buf[pos]; positions must be asked for in increasing order."""
+        mark_pos, mark_offset = self.mark
+        text = self.buf[mark_pos:pos]
+        offset = mark_offset + (len(text) if text.isascii() else len(text.encode("utf-8")))
+        self.mark = (pos, offset)
+        return offset
+
+    def skip_whitespace(self, pos: int) -> int:
+        while True:
+            pos = _WHITESPACE.match(self.buf, pos).end()
+            if pos < len(self.buf) or self.eof:
+                return pos
+            pos = self.fill(pos)
+
+    def decode(self, decoder: json.JSONDecoder, pos: int):
+        """Parse one JSON value at pos, reading more as needed; returns (value, pos, end)."""
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, pos)
+                # A number at the very end of the buffer may continue in the next chunk.
+                if end < len(self.buf) or self.eof:
+                    return value, pos, end
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            pos = self.fill(pos)
+
+def iter_object(path: str, chunk_size: int = READ_CHUNK):
+    """
+    Yield (key, value, start, end) for each member of the JSON object stored in
+    path, in file order, reading chunk_size bytes at a time. start and end are the
+    byte offsets of the value in the file, so it can be read back later on its own.
+    Only one member's value is held in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "rb") as f:
+        reader = _Reader(f, chunk_size)
+        pos = reader.skip_whitespace(0)
+        if reader.buf[pos:pos + 1] != "{":
+            raise ValueError(f"{path} does not contain a JSON object")
+        pos = reader.skip_whitespace(pos + 1)
+        if reader.buf[pos:pos + 1] == "}":
+            return
+        while True:
+            key, pos, end = reader.decode(decoder, pos)
+            if not isinstance(key, str):
+                raise ValueError(f"Expected a key in {path} at byte {reader.offset(pos)}")
+            pos = reader.skip_whitespace(end)
+            if reader.buf[pos:pos + 1] != ":":
+                raise ValueError(f"Expected ':' in {path} at byte {reader.offset(pos)}")
+            pos = reader.skip_whitespace(pos + 1)
+            value, pos, end = reader.decode(decoder, pos)
+            yield key, value, reader.offset(pos), reader.offset(end)
+            pos = reader.skip_whitespace(end)
+            separator = reader.buf[pos:pos + 1]
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or '}}' in {path} at byte {reader.offset(pos)}")
+            pos = reader.skip_whitespace(pos + 1)
+
+def read_value(path: str, start: int, end: int):
+    """Parse the JSON value stored between two byte offsets of a file (see iter_object)."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        return json.loads(f.read(end - start))
@@ -0,0 +1,413 @@
+"""
+Load test for the bot's commands, without Discord.
+
+Loads cogs.drop, cogs.list and cogs.show into an offline bot and drives them with
+stand-ins for discord.Interaction, its response and followup, and the messages
+they create. Simulated traffic runs for a fixed time at a configurable
+concurrency:
+
+- bursty drops: the owner drops a batch of cards every few seconds, and a crowd
+  of collectors presses the claim buttons all at once;
+- /list paging: collectors list their cards with random filters and sorts and
+  page through them with the Next button;
+- /show spam: collectors show the same card several times in a row.
+
+Collections are seeded with synthetic cards (see benchmark.synthetic_collections)
+in a temporary directory, so the bot's data is never touched. Storage, rendering
+and cache settings come from the environment exactly as for the bot
+(STORAGE_BACKEND, RENDER_WORKERS, RENDER_QUEUE_SIZE, ...); fake Discord API calls
+take --api-latency seconds each.
+
+The report gives throughput and p50/p95/p99 latency per command, and how late
+the event loop ran a timer that should have fired every few milliseconds.
+
+Usage:
+  python loadtest.py                                        # defaults below
+  python loadtest.py --duration 60 --concurrency 200 --drop-size 20 --claimers 100
+  RENDER_WORKERS=4 STORAGE_BACKEND=sharded python loadtest.py --output run.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import itertools
+import traceback
+from collections import Counter
+import discord
+
+# Extensions the load test drives.
+COGS = ("cogs.drop", "cogs.list", "cogs.show")
+# Seconds between event loop lag samples.
+LAG_INTERVAL = 0.005
+# Latency percentiles reported for every command.
+PERCENTILES = (50, 95, 99)
+
+_ids = itertools.count(1)
+
+def percentile(values: list, q: float) -> float:
+    """The q-th percentile of values (nearest rank); values must be sorted."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+class FakeApi:
+    """Counts the Discord API calls the cogs make and delays each by a simulated round trip."""
+
+    def __init__(self, latency: float, rng: random.Random):
+        self.latency = latency
+        self.rng = rng
+        self.calls = Counter()
+
+    async def call(self, name: str) -> None:
+        self.calls[name] += 1
+        if self.latency > 0:
+            # Round trips vary; most are close to the mean, a few take much longer.
+            await asyncio.sleep(self.rng.expovariate(1 / self.latency))
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = self.display_name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+
+class FakeMessage:
+    """A sent message; records the CDN URLs Discord would give its attachments."""
+
+    def __init__(self, api: FakeApi, channel, files=(), view=None):
+        self.api = api
+        self.id = next(_ids)
+        self.channel = channel
+        self.view = view
+        self.deleted = False
+        expiry = int(time.time()) + 86400
+        self.attachments = [
+            type("Attachment", (), {
+                "filename": file.filename,
+                "url": f"https://cdn.discordapp.com/attachments/{channel.id}/{next(_ids)}/{file.filename}"
+                       f"?ex={expiry:x}"
+            })
+            for file in files
+        ]
+
+    async def edit(self, **kwargs):
+        await self.api.call("message.edit")
+        self.view = kwargs.get("view", self.view)
+        return self
+
+    async def delete(self):
+        await self.api.call("message.delete")
+        self.deleted = True
+
+class FakeChannel:
+    def __init__(self, api: FakeApi):
+        self.api = api
+        self.id = next(_ids)
+
+    async def send(self, content=None, **kwargs):
+        await self.api.call("channel.send")
+        return FakeMessage(self.api, self, _files(kwargs), kwargs.get("view"))
+
+def _files(kwargs: dict) -> list:
+    files = list(kwargs.get("files") or [])
+    if kwargs.get("file") is not None:
+        files.append(kwargs["file"])
+    return files
+
+class FakeResponse:
+    """Stand-in for InteractionResponse; like Discord, an interaction can only be responded to once."""
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self) -> bool:
+        return self.done
+
+    async def _respond(self, name: str) -> None:
+        if self.done:
+            raise discord.InteractionResponded(self.interaction)
+        self.done = True
+        await self.interaction.api.call(name)
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond("response.send_message")
+        self.interaction.sent.append(FakeMessage(self.interaction.api, self.interaction.channel, _files(kwargs),
+                                                 kwargs.get("view")))
+
+    async def defer(self, **kwargs):
+        await self._respond("response.defer")
+
+    async def edit_message(self, **kwargs):
+        await self._respond("response.edit_message")
+        if self.interaction.message is not None:
+            self.interaction.message.view = kwargs.get("view", self.interaction.message.view)
+
+class FakeFollowup:
+    """Stand-in for the interaction's followup webhook."""
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        interaction = self.interaction
+        await interaction.api.call("followup.send")
+        message = FakeMessage(interaction.api, interaction.channel, _files(kwargs), kwargs.get("view"))
+        interaction.sent.append(message)
+        return message
+
+class FakeInteraction:
+    """
+    The parts of discord.Interaction the cogs use. message is the message a
+    component belongs to (None for slash commands); every message the
+    interaction sends is kept in sent.
+    """
+
+    def __init__(self, api: FakeApi, user: FakeUser, channel: FakeChannel, message: FakeMessage = None):
+        self.api = api
+        self.id = next(_ids)
+        self.user = user
+        self.channel = channel
+        self.message = message
+        self.sent = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+class LoadTest:
+    """Runs the simulated traffic against the loaded cogs and collects latencies."""
+
+    def __init__(self, bot, args, user_ids: list, card_counts: dict):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.api = FakeApi(args.api_latency, random.Random(args.seed + 1))
+        self.channel = FakeChannel(self.api)
+        self.drop_cog = bot.get_cog("DropCog")
+        self.list_cog = bot.get_cog("ListCog")
+        self.show_cog = bot.get_cog("ShowCog")
+        self.user_ids = user_ids
+        self.card_counts = card_counts  # user_id -> seeded cards, to pick /show indexes
+        self.latencies = {}  # command -> seconds per call
+        self.errors = Counter()
+        self.lag = []
+        self.claimed = 0
+        self.tasks = set()
+        self.deadline = None
+
+    def interaction(self, user_id: int, message: FakeMessage = None) -> FakeInteraction:
+        return FakeInteraction(self.api, FakeUser(user_id), self.channel, message)
+
+    async def timed(self, command: str, coro) -> None:
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception:
+            if not self.errors[command]:
+                print(f"{command} failed:")
+                traceback.print_exc()
+            self.errors[command] += 1
+        self.latencies.setdefault(command, []).append(time.perf_counter() - started)
+
+    def spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def think(self, scale: float = 1.0) -> None:
+        await asyncio.sleep(self.rng.expovariate(1 / (self.args.think * scale)) if self.args.think > 0 else 0)
+
+    async def monitor_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lag.append(max(loop.time() - expected, 0.0))
+
+    async def drops(self) -> None:
+        from cogs.drop import MY_USER_ID, ClaimView
+        while time.perf_counter() < self.deadline:
+            interaction = self.interaction(MY_USER_ID)
+            await self.timed("drop", self.drop_cog.drop.callback(self.drop_cog, interaction, count=self.args.drop_size))
+            messages = [message for message in interaction.sent if isinstance(message.view, ClaimView)]
+            if messages:
+                for _ in range(self.args.claimers):
+                    self.spawn(self.claim(messages))
+            await asyncio.sleep(self.args.drop_interval)
+
+    async def claim(self, messages: list) -> None:
+        # Collectors react within a couple of seconds of the drop, most of them early.
+        await asyncio.sleep(self.args.claim_window * self.rng.random() ** 2)
+        message = self.rng.choice(messages)
+        buttons = [item for item in message.view.children if not item.disabled] if message.view else []
+        if message.deleted or not buttons:
+            return
+        button = self.rng.choice(buttons)
+        claimed = button.claimed
+        await self.timed("claim", button.callback(self.interaction(self.rng.choice(self.user_ids), message)))
+        if not claimed and button.claimed:
+            self.claimed += 1
+
+    async def session(self) -> None:
+        """One collector after another running /list and /show, with think time in between."""
+        commands = list(self.args.mix)
+        weights = [self.args.mix[command] for command in commands]
+        while time.perf_counter() < self.deadline:
+            user_id = self.rng.choice(self.user_ids)
+            command = self.rng.choices(commands, weights)[0]
+            if command == "list":
+                await self.list_pages(user_id)
+            else:
+                await self.show_spam(user_id)
+            await self.think()
+
+    async def list_pages(self, user_id: int) -> None:
+        from cogs.list import SORT_CHOICES
+        from card_database import RARITY_CODES
+        interaction = self.interaction(user_id)
+        rarity = self.rng.choice(list(RARITY_CODES)) if self.rng.random() < 0.3 else None
+        sort = self.rng.choice(SORT_CHOICES).value
+        await self.timed("list", self.list_cog.list.callback(self.list_cog, interaction, rarity=rarity, sort=sort))
+        if not interaction.sent or interaction.sent[0].view is None:
+            return
+        message = interaction.sent[0]
+        for _ in range(self.rng.randint(0, 4)):
+            await self.think(0.5)
+            button = message.view.next_page
+            if button.disabled:
+                break
+            await self.timed("list next", button.callback(self.interaction(user_id, message)))
+
+    async def show_spam(self, user_id: int) -> None:
+        index = self.rng.randint(1, max(self.card_counts.get(user_id, 1), 1))
+        for _ in range(self.rng.randint(1, 5)):
+            await self.timed("show", self.show_cog.show.callback(self.show_cog, self.interaction(user_id), index=index))
+            await self.think(0.2)
+
+    async def run(self) -> float:
+        """Run the traffic for the configured duration; returns the elapsed time."""
+        started = time.perf_counter()
+        self.deadline = started + self.args.duration
+        monitor = asyncio.create_task(self.monitor_lag())
+        workers = [asyncio.create_task(self.drops())]
+        workers += [asyncio.create_task(self.session()) for _ in range(self.args.concurrency)]
+        await asyncio.gather(*workers)
+        # Let the last claim bursts finish.
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks))
+        elapsed = time.perf_counter() - started
+        monitor.cancel()
+        return elapsed
+
+    def report(self, elapsed: float) -> dict:
+        results = {"elapsed_s": elapsed, "commands": {}, "api_calls": dict(self.api.calls), "claimed": self.claimed}
+        print(f"\n{'command':<12} {'count':>7} {'errors':>7} {'per s':>8} "
+              + " ".join(f"{f'p{q} ms':>9}" for q in PERCENTILES) + f" {'max ms':>9}")
+        for command, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            entry = {
+                "count": len(latencies),
+                "errors": self.errors[command],
+                "per_s": len(latencies) / elapsed,
+                "max_ms": latencies[-1] * 1000
+            }
+            for q in PERCENTILES:
+                entry[f"p{q}_ms"] = percentile(latencies, q) * 1000
+            results["commands"][command] = entry
+            print(f"{command:<12} {entry['count']:>7} {entry['errors']:>7} {entry['per_s']:>8.1f} "
+                  + " ".join(f"{entry[f'p{q}_ms']:>9.1f}" for q in PERCENTILES) + f" {entry['max_ms']:>9.1f}")
+
+        self.lag.sort()
+        results["loop_lag"] = {f"p{q}_ms": percentile(self.lag, q) * 1000 for q in PERCENTILES}
+        results["loop_lag"]["max_ms"] = self.lag[-1] * 1000 if self.lag else 0.0
+        print("\nEvent loop lag: " + ", ".join(f"{name[:-3]} {value:.1f} ms"
+                                                for name, value in results["loop_lag"].items()))
+        print(f"Cards claimed: {self.claimed}")
+        print("API calls: " + ", ".join(f"{name} {count}" for name, count in sorted(self.api.calls.items())))
+        return results
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        command, _, weight = part.partition("=")
+        if command not in ("list", "show"):
+            raise argparse.ArgumentTypeError(f"unknown command in mix: {command}")
+        mix[command] = float(weight or 1)
+    return mix
+
+async def run(args) -> dict:
+    import responses
+    from benchmark import synthetic_collections
+    from discord.ext import commands
+    from render_service import render_service
+    from attachment_cache import attachment_cache
+
+    # Seed the collections the way an existing bot would find them: in collections.json,
+    # migrated or split by the configured backend as it opens.
+    collections = synthetic_collections(args.cards, args.users, args.seed)
+    with open("collections.json", "w") as f:
+        json.dump(collections, f)
+    started = time.perf_counter()
+    responses.get_store().start()
+    print(f"Seeded {args.cards} cards for {len(collections)} users in {time.perf_counter() - started:.2f}s")
+
+    bot = commands.Bot(command_prefix="^", intents=discord.Intents.default())
+    for extension in COGS:
+        await bot.load_extension(extension)
+
+    load_test = LoadTest(bot, args, [int(user_key) for user_key in collections],
+                         {int(user_key): len(cards) for user_key, cards in collections.items()})
+    del collections
+    print(f"Running for {args.duration:g}s: {args.concurrency} sessions, {args.drop_size} cards dropped every "
+          f"{args.drop_interval:g}s with {args.claimers} claimers")
+    try:
+        elapsed = await load_test.run()
+    finally:
+        render_service.close()
+        await attachment_cache.close()
+        await responses.shutdown_store()
+    return load_test.report(elapsed)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Drive the bot's commands with simulated traffic, offline.")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of traffic")
+    parser.add_argument("--concurrency", type=int, default=50, help="collectors running /list and /show at once")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("list=3,show=2"),
+                        help="relative weights of /list and /show sessions")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between a collector's commands")
+    parser.add_argument("--drop-interval", type=float, default=5, help="seconds between drops")
+    parser.add_argument("--drop-size", type=int, default=10, help="cards per drop")
+    parser.add_argument("--claimers", type=int, default=30, help="claim button presses per drop")
+    parser.add_argument("--claim-window", type=float, default=2, help="seconds over which a drop's presses arrive")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="mean seconds per fake Discord API call")
+    parser.add_argument("--cards", type=int, default=50_000, help="synthetic cards to seed the collections with")
+    parser.add_argument("--users", type=int, default=1_000, help="synthetic collectors")
+    parser.add_argument("--seed", type=int, default=1234, help="seed for the collections and the traffic")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    here = os.getcwd()
+    repo = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo)
+    # Fake attachment URLs can't be checked against the CDN.
+    os.environ["ATTACHMENT_VERIFY"] = "0"
+    with tempfile.TemporaryDirectory(prefix="cardbot-loadtest-") as workdir:
+        # The bot keeps its data files next to it and reads card art from assets/.
+        os.chdir(workdir)
+        try:
+            os.symlink(os.path.join(repo, "assets"), "assets", target_is_directory=True)
+            results = asyncio.run(run(args))
+        finally:
+            os.chdir(here)
+
+    if output:
+        results["settings"] = {name: value for name, value in vars(args).items() if name != "output"}
+        with open(output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Wrote results to {output}")
+    return 1 if any(entry["errors"] for entry in results["commands"].values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,9 @@
 import os
+import time
+
+# Reference point for the startup report.
+STARTED = time.perf_counter()
+
 from dotenv import load_dotenv
 import discord
 from discord.ext import commands
@@ -7,20 +12,41 @@ from discord.ext import commands
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 
+# Imported after load_dotenv so the render pool and storage settings can come from .env.
+from render_service import render_service
+from responses import get_store, get_user_collections, shutdown_store
+from attachment_cache import attachment_cache
+from metrics import metrics_server, peak_memory_mb
+
+IMPORTED = time.perf_counter()
+
 # Set up bot intents and the command prefix.
 intents = discord.Intents.default()
 intents.message_content = True
 
 class MyBot(commands.Bot):
     async def setup_hook(self):
+        self.startup_times = {"imports": IMPORTED - STARTED}
+
+        # Open storage and start flushing claimed cards to it in the background.
+        # Collections themselves are only read as users show up.
+        started = time.perf_counter()
+        get_store().start()
+        self.startup_times["storage"] = time.perf_counter() - started
+
+        # Start sampling event loop lag, and serve /metrics if METRICS_PORT is set.
+        await metrics_server.start()
+
         # Load cog extensions asynchronously.
-        extensions = ['cogs.drop', 'cogs.list', 'cogs.show']
+        started = time.perf_counter()
+        extensions = ['cogs.drop', 'cogs.list', 'cogs.show', 'cogs.search', 'cogs.leaderboard', 'cogs.botstats']
         for ext in extensions:
             try:
                 await self.load_extension(ext)
                 print(f"Loaded extension: {ext}")
             except Exception as e:
                 print(f"Failed to load extension {ext}: {e}")
+        self.startup_times["extensions"] = time.perf_counter() - started
         # Sync slash commands.
         try:
             await self.tree.sync()
@@ -28,12 +54,31 @@ class MyBot(commands.Bot):
         except Exception as e:
             print(f"Failed to sync slash commands: {e}")
 
+    async def close(self):
+        # Stop the card render worker processes and close storage along with the bot.
+        render_service.close()
+        await super().close()
+        await attachment_cache.close()
+        await shutdown_store()
+        await metrics_server.close()
+
 # Initialize the bot using our custom subclass.
 bot = MyBot(command_prefix="^", intents=intents)
 
 @bot.event
 async def on_ready():
     print(f"Logged in as {bot.user}")
+    if not hasattr(bot, "startup_reported"):
+        # on_ready fires again after reconnects; report startup only once.
+        bot.startup_reported = True
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in bot.startup_times.items())
+        report = f"Startup took {time.perf_counter() - STARTED:.2f}s ({phases})"
+        peak = peak_memory_mb()
+        if peak is not None:
+            report += f", peak memory {peak:.0f} MB"
+        print(report + f", {len(get_user_collections().users)} collections loaded")
 
-# Run the bot.
-bot.run(TOKEN)
+# Run the bot. The guard keeps render worker processes that re-import this
+# module (spawn start method, e.g. on Windows) from starting a second bot.
+if __name__ == "__main__":
+    bot.run(TOKEN)
@@ -0,0 +1,295 @@
+import os
+import time
+import bisect
+import asyncio
+import functools
+import threading
+try:
+    import resource
+except ImportError:  # Not available on Windows; memory is left out.
+    resource = None
+
+# Set to "0" to turn instrumentation off; recording then costs a single flag check.
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+# Port of the local Prometheus endpoint (/metrics); 0 leaves it off.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Interface the endpoint listens on; keep it local unless a scraper needs it elsewhere.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Seconds between event loop lag samples.
+LOOP_LAG_INTERVAL = 0.5
+
+# Histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []  # Every metric, in the order they are exported.
+_caches = {}  # cache name -> function returning (hits, misses)
+STARTED = time.time()
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """A monotonically increasing total per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}  # label values -> total
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        return self.values.get(label_values, 0)
+
+    def snapshot(self) -> dict:
+        """label values -> total, copied under the lock."""
+        with self.lock:
+            return dict(self.values)
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for label_values, value in items:
+            yield self.name + _label_text(self.labels, label_values), value
+
+class Histogram:
+    """Observations counted into fixed buckets, plus their sum and count, per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, *label_values) -> None:
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *label_values):
+        """Context manager observing the duration of its block."""
+        return _Timer(self, label_values)
+
+    def keys(self) -> list:
+        """Every combination of label values observed so far, copied under the lock."""
+        with self.lock:
+            return list(self.values)
+
+    def count(self, *label_values) -> int:
+        with self.lock:
+            entry = self.values.get(label_values)
+            return entry[2] if entry else 0
+
+    def mean(self, *label_values) -> float:
+        with self.lock:
+            entry = self.values.get(label_values)
+            return entry[1] / entry[2] if entry else 0.0
+
+    def quantile(self, q: float, *label_values):
+        """Upper bound of the bucket holding the q-th quantile (inf past the last bucket), or None if empty."""
+        with self.lock:
+            entry = self.values.get(label_values)
+            if not entry:
+                return None
+            counts, _, count = entry
+            counts = list(counts)
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= q * count:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def samples(self):
+        with self.lock:
+            items = [(label_values, list(counts), total, count) for label_values, (counts, total, count)
+                     in self.values.items()]
+        for label_values, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = 'le="' + (bound if isinstance(bound, str) else _number(bound)) + '"'
+                yield self.name + "_bucket" + _label_text(self.labels, label_values, le), cumulative
+            yield self.name + "_sum" + _label_text(self.labels, label_values), total
+            yield self.name + "_count" + _label_text(self.labels, label_values), count
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "started")
+
+    def __init__(self, histogram: Histogram, label_values: tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+class _CacheCounter:
+    """Exports the hit or miss totals that caches keep themselves, read at scrape time."""
+
+    kind = "counter"
+    labels = ("cache",)
+
+    def __init__(self, name: str, help_text: str, position: int):
+        self.name = name
+        self.help = help_text
+        self.position = position
+        _registry.append(self)
+
+    def samples(self):
+        for cache, read in list(_caches.items()):
+            yield self.name + _label_text(self.labels, (cache,)), read()[self.position]
+
+def register_cache(name: str, read) -> None:
+    """Export a cache's hit rate; read() returns its (hits, misses) totals so far."""
+    _caches[name] = read
+
+def peak_memory_mb():
+    """Peak resident memory of the process so far, in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+def cache_hit_rates() -> dict:
+    """cache name -> (hits, misses, hit rate or None)."""
+    rates = {}
+    for name, read in list(_caches.items()):
+        hits, misses = read()
+        rates[name] = (hits, misses, hits / (hits + misses) if hits + misses else None)
+    return rates
+
+# --- The bot's metrics ---
+
+command_duration = Histogram("cardbot_command_duration_seconds",
+                             "Time to handle a slash command or button press.", ("command",))
+command_errors = Counter("cardbot_command_errors_total", "Commands and button presses that raised.", ("command",))
+render_duration = Histogram("cardbot_render_duration_seconds",
+                            "Time to get a card image, including the wait for a render worker.", ("profile",))
+render_phase = Histogram("cardbot_render_phase_seconds",
+                         "Time spent in each phase of rendering a card image inside a worker.", ("phase",))
+render_fallbacks = Counter("cardbot_render_fallbacks_total",
+                           "Card images that could not be produced, by reason.", ("reason",))
+storage_duration = Histogram("cardbot_storage_operation_seconds",
+                             "Time spent in storage backend operations.", ("backend", "operation"))
+storage_bytes = Counter("cardbot_storage_bytes_total",
+                        "Bytes read from and written to collection files.", ("direction",))
+serial_allocation = Histogram("cardbot_serial_allocation_seconds", "Time to reserve serial numbers.", ("kind",))
+loop_lag = Histogram("cardbot_event_loop_lag_seconds", "How late the event loop ran a timer.")
+cache_hits = _CacheCounter("cardbot_cache_hits_total", "Cache lookups that were served from the cache.", 0)
+cache_misses = _CacheCounter("cardbot_cache_misses_total", "Cache lookups that missed.", 1)
+
+def timed(command: str):
+    """
+    Decorator recording an async handler's duration under command (and counting it
+    as an error if it raises). Returns the handler unchanged with metrics off.
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                command_errors.inc(command)
+                raise
+            finally:
+                command_duration.observe(time.perf_counter() - started, command)
+        return wrapper
+    return decorator
+
+def render_text() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name} {_number(value)}" for name, value in metric.samples())
+    lines.append("# HELP cardbot_uptime_seconds Seconds since the bot started.")
+    lines.append("# TYPE cardbot_uptime_seconds gauge")
+    lines.append(f"cardbot_uptime_seconds {_number(time.time() - STARTED)}")
+    peak = peak_memory_mb()
+    if peak is not None:
+        lines.append("# HELP cardbot_peak_memory_bytes Peak resident memory of the bot process.")
+        lines.append("# TYPE cardbot_peak_memory_bytes gauge")
+        lines.append(f"cardbot_peak_memory_bytes {int(peak * 1024 * 1024)}")
+    return "\n".join(lines) + "\n"
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL) -> None:
+    """Sample how late the event loop wakes up from a sleep, forever."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(loop.time() - expected, 0.0))
+
+class MetricsServer:
+    """Serves render_text() at /metrics over HTTP, and samples event loop lag while running."""
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.host = host
+        self.port = port
+        self.runner = None
+        self.lag_task = None
+
+    async def start(self) -> None:
+        if not METRICS_ENABLED:
+            return
+        self.lag_task = asyncio.create_task(monitor_loop_lag())
+        if not self.port:
+            return
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(text=render_text(), content_type="text/plain", charset="utf-8")
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def close(self) -> None:
+        if self.lag_task is not None:
+            self.lag_task.cancel()
+            self.lag_task = None
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+# Shared server started by the bot.
+metrics_server = MetricsServer()
@@ -1,4 +1,5 @@
 import json
+import os
 
 DATA_FILE = "card_counts.json"
 
@@ -10,5 +11,75 @@ def load_card_counts() -> dict:
         return {}
 
 def save_card_counts(counts: dict) -> None:
-    with open(DATA_FILE, "w") as f:
+    # Write to a temporary file and swap it in so a crash never leaves a half-written index.
+    tmp_file = DATA_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
         json.dump(counts, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, DATA_FILE)
+
+def split_serial(serial_number: str):
+    """
+    Split a serial like "ICHI-CM-ISYO3-15" into its prefix and number
+    ("ICHI-CM-ISYO3", 15). Returns (None, None) if it does not end in a number.
+    """
+    prefix, _, number = serial_number.rpartition("-")
+    if not prefix or not number.isdigit():
+        return None, None
+    return prefix, int(number)
+
+def rebuild_card_counts(user_card_lists) -> dict:
+    """
+    Rebuild the serial counter index from stored collections in a single pass,
+    given each user's list of card dicts (e.g. collections.values(), or a generator
+    so the collections never have to be in memory at once).
+    Each serial prefix maps to the highest number issued for it so far.
+    """
+    counts = {}
+    for user_cards in user_card_lists:
+        count_serials(counts, user_cards)
+    return counts
+
+def count_serials(counts: dict, cards: list) -> None:
+    """Raise the counters in counts to cover the serial numbers of the given card dicts."""
+    for card in cards:
+        prefix, number = split_serial(card["serial_number"])
+        if prefix is not None and number > counts.get(prefix, 0):
+            counts[prefix] = number
+
+def load_or_rebuild_card_counts(user_card_lists) -> dict:
+    """
+    Load the serial counter index, rebuilding (and saving) it from each user's card
+    list if it is missing or still in the old "name|rarity|set" format. The lists
+    are only read when a rebuild is needed.
+    """
+    counts = load_card_counts()
+    if counts and not any("|" in key for key in counts):
+        return counts
+    counts = rebuild_card_counts(user_card_lists)
+    save_card_counts(counts)
+    return counts
+
+def allocate_serial_number(counts: dict, prefix: str) -> int:
+    """Reserve the next number for a serial prefix and persist the updated index."""
+    return allocate_serial_blocks(counts, {prefix: 1})[prefix]
+
+def allocate_serial_blocks(counts: dict, block_sizes: dict) -> dict:
+    """
+    Reserve a block of consecutive numbers for each serial prefix in block_sizes
+    (prefix -> how many), persisting the index once. Returns prefix -> first number.
+    """
+    first_numbers = {}
+    for prefix, size in block_sizes.items():
+        first_numbers[prefix] = counts.get(prefix, 0) + 1
+        counts[prefix] = counts.get(prefix, 0) + size
+    save_card_counts(counts)
+    return first_numbers
+
+# Rebuild the index by hand, e.g. after restoring collections from a backup.
+if __name__ == "__main__":
+    from storage import JsonCollectionStore
+    rebuilt = rebuild_card_counts(cards for _, cards in JsonCollectionStore().iter_collections())
+    save_card_counts(rebuilt)
+    print(f"Rebuilt {len(rebuilt)} serial counters into {DATA_FILE}")
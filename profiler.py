@@ -0,0 +1,182 @@
+import os
+import sys
+import time
+import atexit
+import shutil
+import asyncio
+import tempfile
+import threading
+import multiprocessing
+from collections import Counter
+
+# Seconds between stack samples (100 per second keeps the overhead around a percent).
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
+# Longest profile the /profile command will run, in seconds.
+PROFILE_MAX_SECONDS = 300
+# How long to wait for the render workers to write their samples after a profile.
+WORKER_FLUSH_WAIT = 0.5
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_labels = {}  # code object -> frame label
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(REPO_DIR):
+            filename = os.path.relpath(filename, REPO_DIR)
+        else:
+            # Library code: keep the package and module, e.g. asyncio/base_events.py.
+            filename = "/".join(filename.replace("\\", "/").split("/")[-2:])
+        label = _labels[code] = f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})"
+    return label
+
+class StackSampler:
+    """
+    Samples the Python stack of every thread in this process (and, given an event
+    loop, the await chain of every task on it) and counts identical stacks, in the
+    collapsed format used by flamegraph.pl and speedscope: root;caller;callee count.
+    """
+
+    def __init__(self, root: str, loop: asyncio.AbstractEventLoop = None, interval: float = PROFILE_INTERVAL):
+        self.root = root
+        self.loop = loop
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+
+    def sample(self) -> None:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread {ident}"))
+            stack.append(self.root)
+            self.counts[";".join(reversed(stack))] += 1
+
+        if self.loop is not None:
+            try:
+                tasks = asyncio.all_tasks(self.loop)
+            except RuntimeError:  # The loop's task set changed too often while copying it.
+                tasks = ()
+            for task in tasks:
+                stack = ["tasks"]
+                awaitable = task.get_coro()
+                while awaitable is not None:
+                    frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+                    if frame is None:
+                        # Something that isn't a running coroutine, e.g. the Future it waits on.
+                        stack.append(type(awaitable).__name__)
+                        break
+                    stack.append(_label(frame.f_code))
+                    awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+                self.counts[";".join(stack)] += 1
+        self.samples += 1
+
+    def run(self, keep_going) -> None:
+        """Sample every interval for as long as keep_going() returns true."""
+        next_sample = time.perf_counter()
+        while keep_going():
+            self.sample()
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Sampling fell behind (e.g. the GIL was busy); don't try to catch up.
+                next_sample = time.perf_counter()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+# --- Render workers ---
+
+_worker_control = None
+
+def worker_control() -> tuple:
+    """
+    The (event, directory) pair render workers are started with. While the event
+    is set each worker samples itself; once it clears, each writes its samples to
+    the directory. Created on first use, in the bot's process.
+    """
+    global _worker_control
+    if _worker_control is None:
+        directory = tempfile.mkdtemp(prefix="cardbot-profile-")
+        atexit.register(shutil.rmtree, directory, True)
+        _worker_control = (multiprocessing.Event(), directory)
+    return _worker_control
+
+def install_worker_sampler(control: tuple) -> None:
+    """Run in each render worker as it starts: sample it whenever the control event is set."""
+    event, directory = control
+
+    def serve():
+        while True:
+            event.wait()
+            sampler = StackSampler(f"render worker {os.getpid()}")
+            sampler.run(event.is_set)
+            path = os.path.join(directory, f"worker-{os.getpid()}.folded")
+            with open(path + ".tmp", "w") as f:
+                f.write(sampler.folded())
+            os.replace(path + ".tmp", path)
+
+    threading.Thread(target=serve, name="profile sampler", daemon=True).start()
+
+# --- Profiling the running bot ---
+
+_running = False
+
+def is_running() -> bool:
+    return _running
+
+async def profile(seconds: float, interval: float = PROFILE_INTERVAL) -> tuple:
+    """
+    Sample the bot's threads, its event loop tasks and the render workers for the
+    given number of seconds; returns (collapsed stacks text, StackSampler of this
+    process). Only one profile runs at a time.
+    """
+    global _running
+    if _running:
+        raise RuntimeError("A profile is already running.")
+    _running = True
+    try:
+        sampler = StackSampler("bot", asyncio.get_running_loop(), interval)
+        stop = threading.Event()
+        thread = threading.Thread(target=sampler.run, args=(lambda: not stop.is_set(),),
+                                  name="profile sampler", daemon=True)
+        event, directory = worker_control()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        event.set()
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            event.clear()
+            await asyncio.to_thread(thread.join)
+
+        await asyncio.sleep(WORKER_FLUSH_WAIT)
+        folded = sampler.folded()
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".folded"):
+                with open(os.path.join(directory, name), "r") as f:
+                    folded += f.read()
+                os.remove(os.path.join(directory, name))
+        return folded, sampler
+    finally:
+        _running = False
+
+def hottest_frames(sampler: StackSampler, thread_prefix: str = "bot;MainThread;", limit: int = 5) -> list:
+    """The functions most often on top of the stack in one thread, as (label, share of samples)."""
+    leaves = Counter()
+    for stack, count in sampler.counts.items():
+        if stack.startswith(thread_prefix):
+            leaves[stack.rsplit(";", 1)[-1]] += count
+    return [(label, count / sampler.samples) for label, count in leaves.most_common(limit)] if sampler.samples else []
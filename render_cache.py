@@ -0,0 +1,174 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import metrics
+
+# Where rendered cards are kept between restarts.
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join("cache", "renders"))
+# Size caps for the in-memory and on-disk tiers, in megabytes.
+RENDER_CACHE_MEMORY_MB = int(os.getenv("RENDER_CACHE_MEMORY_MB", "64"))
+RENDER_CACHE_DISK_MB = int(os.getenv("RENDER_CACHE_DISK_MB", "1024"))
+
+# Bump when the card layout, fonts or art change so old renders are no longer used.
+RENDER_CACHE_VERSION = 1
+
+def card_cache_key(card, profile: str) -> str:
+    """Content hash of everything that determines a card's rendered image."""
+    content = json.dumps([
+        RENDER_CACHE_VERSION,
+        profile,
+        card.serial_number,
+        card.name,
+        card.card_set,
+        card.rarity,
+        getattr(card, "variant", None),
+        card.stats
+    ], sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+class RenderCache:
+    """
+    Two-tier cache of encoded card images keyed by card_cache_key().
+
+    The memory tier is an LRU capped at memory_bytes. The disk tier keeps one file
+    per key under directory, capped at disk_bytes; reads refresh a file's position
+    so the least recently used files are evicted first. Disk methods do blocking
+    I/O, so call them from a worker thread.
+    """
+
+    def __init__(self, directory: str = RENDER_CACHE_DIR,
+                 memory_bytes: int = RENDER_CACHE_MEMORY_MB * 1024 * 1024,
+                 disk_bytes: int = RENDER_CACHE_DISK_MB * 1024 * 1024):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()  # key -> bytes
+        self.memory_used = 0
+        self.disk = None  # key -> file size, least recently used first; scanned on first use
+        self.disk_used = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # --- Memory tier ---
+
+    def get_memory(self, key: str):
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+            return data
+
+    def put_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_bytes:
+            return
+        with self.lock:
+            old = self.memory.pop(key, None)
+            if old is not None:
+                self.memory_used -= len(old)
+            self.memory[key] = data
+            self.memory_used += len(data)
+            while self.memory_used > self.memory_bytes:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_used -= len(evicted)
+
+    # --- Disk tier ---
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".bin")
+
+    def _scan_disk(self) -> None:
+        """Build the disk index from the cache directory, oldest access first."""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".bin"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        entries.sort()
+        self.disk = OrderedDict((key, size) for _, key, size in entries)
+        self.disk_used = sum(self.disk.values())
+
+    def get_disk(self, key: str):
+        with self.lock:
+            if self.disk is None:
+                self._scan_disk()
+            if key not in self.disk:
+                self.misses += 1
+                return None
+            self.disk.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Mark as recently used for eviction after a restart.
+        except FileNotFoundError:
+            with self.lock:
+                self.disk_used -= self.disk.pop(key, 0)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        self.put_memory(key, data)
+        return data
+
+    def put_disk(self, key: str, data: bytes) -> None:
+        """Store a render on disk; errors (e.g. a full disk) are logged, not raised."""
+        try:
+            self._put_disk(key, data)
+        except OSError as e:
+            print(f"Error writing render cache: {e}")
+
+    def _put_disk(self, key: str, data: bytes) -> None:
+        if len(data) > self.disk_bytes:
+            return
+        path = self._path(key)
+        with self.lock:
+            if self.disk is None:
+                self._scan_disk()
+            if key in self.disk:
+                return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self.lock:
+            if key in self.disk:  # Another thread stored it meanwhile.
+                return
+            self.disk[key] = len(data)
+            self.disk_used += len(data)
+            while self.disk_used > self.disk_bytes:
+                old_key, size = self.disk.popitem(last=False)
+                self.disk_used -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        """Drop every cached render, e.g. after the layout or assets change."""
+        with self.lock:
+            self.memory.clear()
+            self.memory_used = 0
+            if self.disk is None:
+                self._scan_disk()
+            keys = list(self.disk)
+            self.disk = OrderedDict()
+            self.disk_used = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+# Shared cache used by the render service.
+render_cache = RenderCache()
+metrics.register_cache("render", lambda: (render_cache.hits, render_cache.misses))
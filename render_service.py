@@ -0,0 +1,193 @@
+import os
+import io  # for BytesIO
+import time
+import asyncio
+import metrics
+import profiler
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+from imgen import generate_card_image, get_render_context, get_asset_bundle, OUTPUT_PROFILES
+from render_cache import render_cache, card_cache_key
+
+# Number of worker processes rendering card images.
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+# Number of renders allowed to wait for a free worker before new ones are refused.
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", "8"))
+# How long (seconds) a caller waits for a queue slot before falling back to text.
+RENDER_QUEUE_WAIT = float(os.getenv("RENDER_QUEUE_WAIT", "0.5"))
+# How long (seconds) a single render may take before it is abandoned.
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "10"))
+
+def _card_fields(card) -> dict:
+    """Extract the attributes generate_card_image needs into a picklable dict."""
+    return {
+        "name": card.name,
+        "card_set": card.card_set,
+        "rarity": card.rarity,
+        "serial_number": card.serial_number,
+        "stats": dict(card.stats),
+        "variant": getattr(card, "variant", None)
+    }
+
+def _render_job(fields: dict, profile: str, timed: bool = False):
+    """
+    Runs inside a worker process; returns (file name, encoded bytes, phase timings)
+    or None. Phase timings (see generate_card_image) are only measured if timed.
+    """
+    timings = {} if timed else None
+    image_stream = generate_card_image(SimpleNamespace(**fields), profile=profile, timings=timings)
+    if image_stream is None:
+        return None
+    return image_stream.name, image_stream.getvalue(), timings
+
+def _init_worker(profile_control: tuple) -> None:
+    """Runs as each worker process starts."""
+    # Load fonts and glyph atlases and map the baked card art once, up front.
+    get_render_context()
+    get_asset_bundle()
+    # Let /profile sample the worker too.
+    profiler.install_worker_sampler(profile_control)
+
+class RenderService:
+    """
+    Renders card images in a process pool so Pillow never blocks the event loop.
+
+    At most workers + queue_size renders are in flight at once. When every slot is
+    taken (or a render times out) render() returns None, and callers fall back to a
+    text-only embed just like a failed render.
+    """
+
+    def __init__(self, workers: int = RENDER_WORKERS, queue_size: int = RENDER_QUEUE_SIZE,
+                 queue_wait: float = RENDER_QUEUE_WAIT, timeout: float = RENDER_TIMEOUT):
+        self.workers = max(workers, 1)
+        self.queue_size = max(queue_size, 0)
+        self.queue_wait = queue_wait
+        self.timeout = timeout
+        self._executor = None
+        self._slots = None
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 initargs=(profiler.worker_control(),))
+            self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+    def reload(self) -> None:
+        """
+        Restart the workers so they pick up changed fonts, layout or assets, and drop
+        cached renders made with the old ones.
+        """
+        self.close()
+        render_cache.clear()
+        self.start()
+
+    async def render(self, card, profile: str = "full", cache: bool = False):
+        """
+        Render the card off the event loop with the given output profile
+        (see imgen.OUTPUT_PROFILES); returns a named BytesIO or None.
+
+        With cache=True, a previous render of the same card content is reused from
+        the render cache, and a new render is stored in it.
+        """
+        started = time.perf_counter()
+        if cache:
+            key = card_cache_key(card, profile)
+            data = render_cache.get_memory(key)
+            if data is None:
+                data = await asyncio.to_thread(render_cache.get_disk, key)
+            if data is not None:
+                image_stream = io.BytesIO(data)
+                image_stream.name = f"{card.serial_number}.{OUTPUT_PROFILES[profile]['extension']}"
+                metrics.render_duration.observe(time.perf_counter() - started, profile)
+                return image_stream
+
+        result = await self._render(card, profile)
+        metrics.render_duration.observe(time.perf_counter() - started, profile)
+        if result is None:
+            return None
+        name, data = result
+        if cache:
+            render_cache.put_memory(key, data)
+            # Write the disk copy in the background; the caller doesn't need to wait for it.
+            asyncio.get_running_loop().run_in_executor(None, render_cache.put_disk, key, data)
+        image_stream = io.BytesIO(data)
+        image_stream.name = name
+        return image_stream
+
+    async def _render(self, card, profile: str, retry: bool = True):
+        """Run one render job in the pool; returns (file name, bytes) or None."""
+        self.start()
+        slots = self._slots
+        try:
+            await asyncio.wait_for(slots.acquire(), self.queue_wait)
+        except asyncio.TimeoutError:
+            print("Render pool saturated; sending card without image.")
+            metrics.render_fallbacks.inc("saturated")
+            return None
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, _render_job, _card_fields(card), profile,
+                                          metrics.METRICS_ENABLED)
+        except BrokenProcessPool as e:
+            # A worker died while no render was waiting on it (e.g. killed for memory, or
+            # stuck on a render nobody awaits any more); the pool takes no more jobs.
+            slots.release()
+            print(f"Render pool broken, restarting: {e}")
+            self.close()
+            if retry:
+                return await self._render(card, profile, retry=False)
+            metrics.render_fallbacks.inc("error")
+            return None
+        except RuntimeError as e:  # Executor was shut down.
+            slots.release()
+            print(f"Error submitting render job: {e}")
+            metrics.render_fallbacks.inc("error")
+            return None
+        # Free the slot only once the worker is actually done, even if we stop waiting.
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            print(f"Render timed out after {self.timeout}s: {card.serial_number}")
+            metrics.render_fallbacks.inc("timeout")
+            return None
+        except BrokenProcessPool as e:
+            # A worker crashed; start a fresh pool for the next render.
+            print(f"Render pool broken, restarting: {e}")
+            self.close()
+            metrics.render_fallbacks.inc("error")
+            return None
+        except Exception as e:
+            print(f"Error rendering card image: {e}")
+            metrics.render_fallbacks.inc("error")
+            return None
+        if result is None:
+            # Missing card art or background.
+            metrics.render_fallbacks.inc("assets")
+            return None
+        name, data, timings = result
+        for phase, seconds in (timings or {}).items():
+            metrics.render_phase.observe(seconds, phase)
+        return name, data
+
+# Shared service used by the cogs.
+render_service = RenderService()
+
+async def render_card(card, profile: str = "full", cache: bool = False):
+    """Convenience wrapper around the shared RenderService."""
+    return await render_service.render(card, profile, cache)
+
+def check_profile(setting: str, profile: str) -> str:
+    """Return profile if it is an output profile, else fail naming the setting that chose it."""
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"{setting}={profile!r} is not an output profile; use one of: {', '.join(OUTPUT_PROFILES)}")
+    return profile
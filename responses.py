@@ -1,81 +1,151 @@
+import time
 import random
+import asyncio
+from collections import Counter
 from random import randint
-import json
-from card_database import get_random_card, get_char_code, get_rarity_code, get_set_code
+from card_database import get_random_card, get_sampler, serial_prefix
+import metrics
+from storage import open_store
+from card_model import Card, compact_collections, intern_template
+try:
+    import numpy as np
+except ImportError:  # Batch generation falls back to drawing cards one by one.
+    np = None
+from collection_index import UserCollectionIndex
+from collection_cache import UserCollectionCache
+from search_index import CardSearchIndex
+from collection_stats import CollectionStats
 
-# The file used for persistent storage of user collections
-COLLECTION_FILENAME = "collections.json"
+# Storage backend for user collections and serial counters (see storage.py), opened on first use.
+store = None
 
-# Global dictionary to track drop counts per card (keyed by name and rarity)
-card_counts = {}
+def get_store():
+    """Returns the storage backend, opening it the first time."""
+    global store
+    if store is None:
+        store = open_store()
+    return store
 
-def load_collections() -> dict:
-    """Load stored collections from the JSON file."""
-    try:
-        with open(COLLECTION_FILENAME, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+async def shutdown_store() -> None:
+    """Flushes and closes the storage backend if it was ever opened."""
+    if store is not None:
+        await store.shutdown()
+
+# New cards get each base stat plus a random offset between -STAT_OFFSET and +STAT_OFFSET.
+STAT_OFFSET = 10
 
 def generate_serial_number(name: str, rarity: str, card_set: str) -> str:
-    char_code = get_char_code(name)
-    rarity_code = get_rarity_code(rarity)
-    set_code = get_set_code(card_set)
-
-    # Include the card_set in the key so that the numbering is independent per set.
-    key = f"{name}|{rarity}|{card_set}"
-    count = card_counts.get(key, 0) + 1
-
-    # Load persistent collections to ensure uniqueness.
-    collections = load_collections()
-    existing_serials = set()
-    for user_cards in collections.values():
-        for card in user_cards:
-            existing_serials.add(card["serial_number"])
-
-    candidate = f"{set_code}-{rarity_code}-{char_code}-{count}"
-    while candidate in existing_serials:
-        count += 1
-        candidate = f"{set_code}-{rarity_code}-{char_code}-{count}"
-    card_counts[key] = count  # Update the drop counter for this specific card type.
-    return candidate
+    # The counter index is persisted, so numbers keep increasing across restarts.
+    prefix = serial_prefix(name, rarity, card_set)
+    count = get_store().allocate_serial_number(prefix)
+    return f"{prefix}-{count}"
 
 def generate_stats(base_stats: dict) -> dict:
     """
-    Generates dynamic stats by applying a random offset between -10 and +10
-    to each provided base stat.
+    Generates dynamic stats by applying a random offset between -STAT_OFFSET and
+    +STAT_OFFSET to each provided base stat.
     """
     stats = {}
     for stat, base_value in base_stats.items():
-        offset = randint(-10, 10)
+        offset = randint(-STAT_OFFSET, STAT_OFFSET)
         stats[stat] = base_value + offset
     return stats
 
-class Card:
-    def __init__(self, name: str, card_set: str, rarity: str, serial_number: str, stats: dict):
-        self.name = name
-        self.card_set = card_set   # Human‑readable set name (e.g., "Neo Egoist League")
-        self.rarity = rarity
-        self.serial_number = serial_number
-        self.stats = stats
-
-    def __str__(self) -> str:
-        stats_str = "\n".join(f"- {stat}: {value}" for stat, value in self.stats.items())
-        return (
-            f"**Name:** {self.name}\n"
-            f"**Set:** {self.card_set}\n"
-            f"**Rarity:** {self.rarity}\n"
-            f"**Serial Number:** {self.serial_number}\n"
-            f"**Stats:**\n{stats_str}"
-        )
-
 def generate_card() -> Card:
     """
     Retrieves a random card template from the database then creates a new card
     with dynamic stats (base ±10) and a serial number that increments with each drop.
     Uses weighted selection through the card_database's get_random_card.
     """
-    template = get_random_card()
+    return create_card(get_random_card())
+
+def generate_cards(count: int, rng=None) -> list:
+    """
+    Generates count new cards at once, for drops, events and simulations.
+
+    Templates and stat offsets for the whole batch are drawn together (as NumPy
+    arrays when NumPy is installed), and every serial prefix in the batch gets
+    its block of numbers from one store call. rng may be a numpy.random.Generator
+    or a random.Random, for reproducible batches.
+    """
+    if count <= 0:
+        return []
+    sampler = get_sampler()
+    if np is None:
+        templates = sampler.draw(count, rng)
+        stats = [generate_stats(template["base_stats"]) for template in templates]
+        serials = _allocate_serials([_template_prefix(template) for template in templates])
+        return [
+            Card(template["name"], template["set"], template["rarity"], serial_number, card_stats)
+            for template, serial_number, card_stats in zip(templates, serials, stats)
+        ]
+
+    generator = _numpy_generator(rng)
+    card_templates, prefixes, base_stats, stat_counts = _batch_tables(sampler)
+    indexes = sampler.draw_indices(count, generator)
+    offsets = generator.integers(-STAT_OFFSET, STAT_OFFSET + 1, size=(count, base_stats.shape[1]))
+    # One row of little-endian int16 stats per card, the layout Card keeps packed.
+    packed = (base_stats[indexes] + offsets).astype("<i2").tobytes()
+    stride = base_stats.shape[1] * 2
+
+    indexes = indexes.tolist()
+    serials = _allocate_serials([prefixes[i] for i in indexes])
+    return [
+        Card.from_packed(card_templates[i], serial_number, packed[row * stride:row * stride + stat_counts[i] * 2])
+        for row, (i, serial_number) in enumerate(zip(indexes, serials))
+    ]
+
+def _template_prefix(template: dict) -> str:
+    return serial_prefix(template["name"], template["rarity"], template["set"])
+
+def _allocate_serials(prefixes: list) -> list:
+    """Serial numbers for cards with the given prefixes, reserving each prefix's block at once."""
+    next_numbers = get_store().allocate_serial_blocks(Counter(prefixes))
+    serials = []
+    for prefix in prefixes:
+        serials.append(f"{prefix}-{next_numbers[prefix]}")
+        next_numbers[prefix] += 1
+    return serials
+
+# Default NumPy generator for batch generation, created on first use.
+_numpy_rng = None
+
+def _numpy_generator(rng):
+    global _numpy_rng
+    if rng is None:
+        if _numpy_rng is None:
+            _numpy_rng = np.random.default_rng()
+        return _numpy_rng
+    if isinstance(rng, np.random.Generator):
+        return rng
+    # A random.Random (or the random module): seed a NumPy generator from it.
+    return np.random.default_rng(rng.getrandbits(64))
+
+# Per-template lookup tables for batch generation, rebuilt when the sampler changes.
+_batch_sampler = None
+_batch_table_cache = None
+
+def _batch_tables(sampler):
+    """
+    Return (CardTemplate per template, serial prefix per template, base stat matrix
+    padded to the widest template, number of stats per template) for a sampler.
+    """
+    global _batch_sampler, _batch_table_cache
+    if _batch_sampler is not sampler:
+        templates = sampler.templates
+        card_templates = [
+            intern_template(t["name"], t["set"], t["rarity"], None, t["base_stats"].keys()) for t in templates
+        ]
+        stat_counts = [len(t["base_stats"]) for t in templates]
+        base_stats = np.zeros((len(templates), max(stat_counts)), dtype=np.int64)
+        for i, template in enumerate(templates):
+            base_stats[i, :stat_counts[i]] = list(template["base_stats"].values())
+        _batch_table_cache = (card_templates, [_template_prefix(t) for t in templates], base_stats, stat_counts)
+        _batch_sampler = sampler
+    return _batch_table_cache
+
+def create_card(template: dict) -> Card:
+    """Creates a new card from a template with dynamic stats and a fresh serial number."""
     name = template["name"]
     card_set = template["set"]
     rarity = template["rarity"]
@@ -88,38 +158,43 @@ def generate_card() -> Card:
 # --- Persistence for User Collections ---
 
 def load_collections() -> dict:
-    """Load the stored user collections from the JSON file."""
-    try:
-        with open(COLLECTION_FILENAME, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-
-# Global user collections (mapping of user_id to list of card dicts).
-user_collections = load_collections()
+    """Load every stored user collection at once, as compact Cards (for tools; the bot loads lazily)."""
+    return compact_collections(get_store().load_collections())
 
 def save_collections(collections: dict) -> None:
-    """Save the collections dictionary to the JSON file."""
-    with open(COLLECTION_FILENAME, "w") as f:
-        json.dump(collections, f, indent=4)
+    """Replace the stored collections with the given dictionary."""
+    get_store().save_collections(collections)
+
+# Live user collections (user_id -> list of Cards), loaded per user on first access.
+user_collections = None
+
+def get_user_collections() -> UserCollectionCache:
+    """Returns the live user collections, creating the cache the first time."""
+    global user_collections
+    if user_collections is None:
+        user_collections = UserCollectionCache(get_store())
+        # An evicted user's /list index points at the dropped list; rebuild it on next use.
+        user_collections.on_evict.append(lambda user_key: user_indexes.pop(user_key, None))
+        metrics.register_cache("collections", lambda: (user_collections.hits, user_collections.loads))
+    return user_collections
 
 def add_card_to_collection(user_id: int, card: Card) -> None:
     """
-    Adds the card (converted to a dictionary) to the given user's collection,
-    then saves the updated collection.
+    Adds the card to the given user's collection, then persists just that card
+    through the storage backend.
     """
     user_key = str(user_id)
-    if user_key not in user_collections:
-        user_collections[user_key] = []
-    card_data = {
-        "serial_number": card.serial_number,
-        "name": card.name,
-        "set": card.card_set,
-        "rarity": card.rarity,
-        "stats": card.stats
-    }
-    user_collections[user_key].append(card_data)
-    save_collections(user_collections)
+    user_cards = get_user_collections().get(user_key)
+    user_cards.append(card)
+    get_store().add_card(user_key, card)
+    index = user_indexes.get(user_key)
+    if index is not None:
+        index.sync()
+    if search_index is not None:
+        search_index.add(user_key, len(user_cards) - 1, card)
+        collection_stats.add(user_key, card)
+    elif claims_during_build is not None:
+        claims_during_build.append((user_key, len(user_cards) - 1, card))
 
 def generate_card_for_user(user_id: int) -> Card:
     """
@@ -131,8 +206,86 @@ def generate_card_for_user(user_id: int) -> Card:
     return card
 
 def get_user_cards(user_id: int) -> list:
-    """Returns a list of card dictionaries that the user has collected."""
-    return user_collections.get(str(user_id), [])
+    """Returns the list of Cards that the user has collected."""
+    return get_user_collections().get(str(user_id))
+
+# Per-user collection indexes for /list, built on first use and updated on each claim.
+user_indexes = {}
+
+def get_user_index(user_id: int) -> UserCollectionIndex:
+    """Returns the filter/sort index over the user's collection."""
+    user_key = str(user_id)
+    index = user_indexes.get(user_key)
+    if index is None:
+        index = user_indexes[user_key] = UserCollectionIndex(get_user_collections().get(user_key))
+    return index
+
+# Inverted index over every user's cards for /search, and the leaderboards and
+# aggregate statistics for /leaderboard and /stats. Both are built together on first use.
+search_index = None
+collection_stats = None
+# Claims made while load_indexes() builds in a thread, as (user_key, position, card).
+claims_during_build = None
+# The running load_indexes() build, shared by everything waiting on it.
+index_build = None
+
+def build_indexes() -> tuple:
+    """
+    Build a CardSearchIndex and CollectionStats in one pass over every collection;
+    returns (search index, collection stats) without installing them.
+    """
+    started = time.perf_counter()
+    index, stats = CardSearchIndex(), CollectionStats()
+    count = 0
+    for user_key, user_cards in get_user_collections().iter_all():
+        # Live lists can grow during a threaded build; give both the same cards.
+        user_cards = list(user_cards)
+        index.extend(user_key, user_cards)
+        stats.extend(user_key, user_cards)
+        count += len(user_cards)
+    index.finish()
+    stats.finish()
+    print(f"Indexed {count} cards for search and stats in {time.perf_counter() - started:.2f}s")
+    return index, stats
+
+async def load_indexes() -> None:
+    """Build the search index and collection stats on a worker thread, once."""
+    global index_build
+    if search_index is None:
+        if index_build is None:
+            index_build = asyncio.ensure_future(_build_indexes_in_thread())
+        await asyncio.shield(index_build)
+
+async def _build_indexes_in_thread() -> None:
+    global search_index, collection_stats, claims_during_build, index_build
+    claims_during_build = []
+    try:
+        index, stats = await asyncio.to_thread(build_indexes)
+        # Add claims the scan missed; a card the scan saw is in both.
+        for user_key, pos, card in claims_during_build:
+            if not index.has_serial(card.serial_number):
+                index.add(user_key, pos, card)
+                stats.add(user_key, card)
+        if search_index is None:  # Unless a synchronous get_search_index() got there first.
+            search_index, collection_stats = index, stats
+    finally:
+        claims_during_build = None
+        index_build = None
+
+def indexes_ready() -> bool:
+    return search_index is not None
+
+def get_search_index() -> CardSearchIndex:
+    """Returns the search index, building it (on this thread) the first time."""
+    global search_index, collection_stats
+    if search_index is None:
+        search_index, collection_stats = build_indexes()
+    return search_index
+
+def get_collection_stats() -> CollectionStats:
+    """Returns the collection statistics, computing them (on this thread) the first time."""
+    get_search_index()
+    return collection_stats
 
 def get_response(user_input: str) -> str:
     """
@@ -0,0 +1,192 @@
+import re
+import bisect
+from functools import lru_cache
+from card_database import get_rarity_code, get_set_code
+
+# Stat names accepted in range queries, including the abbreviations printed on cards.
+STAT_ALIASES = {
+    "offense": "Offense", "off": "Offense",
+    "speed": "Speed", "spd": "Speed",
+    "defense": "Defense", "def": "Defense",
+    "pass": "Pass", "pas": "Pass",
+    "dribble": "Dribble", "dri": "Dribble",
+    "shoot": "Shoot", "sho": "Shoot"
+}
+
+# Fields that can prefix a search word, e.g. "set:ichinan" or "rarity:lg".
+TEXT_FIELDS = ("name", "set", "rarity", "variant", "owner")
+
+_RANGE_TERM = re.compile(r"^([a-z]+)(>=|<=|>|<|=)(\d+)$")
+
+def _words(text: str) -> list:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+@lru_cache(maxsize=4096)
+def _template_tokens(name: str, card_set: str, rarity: str, variant: str) -> frozenset:
+    # Cards of one template share these tokens, so only compute them once per template.
+    fields = {
+        "name": _words(name),
+        "set": _words(card_set) + _words(get_set_code(card_set)),
+        "rarity": _words(rarity) + _words(get_rarity_code(rarity)),
+        "variant": _words(variant)
+    }
+    tokens = set()
+    for field, words in fields.items():
+        for word in words:
+            tokens.add(word)
+            tokens.add(f"{field}:{word}")
+    return frozenset(tokens)
+
+def card_tokens(user_key: str, card) -> set:
+    """All index tokens for a card: bare words plus field-qualified "field:word" tokens."""
+    serial_parts = card.serial_number.split("-")
+    # Cards don't store their variant; it is the character code inside the serial.
+    variant = serial_parts[2] if len(serial_parts) == 4 else ""
+    return _template_tokens(card.name, card.card_set, card.rarity, variant) | {f"owner:{user_key}"}
+
+def _doc_stat(doc: tuple, stat: str):
+    """One stat of an indexed card, or None if its template has no such stat."""
+    template, packed_stats = doc[3], doc[4]
+    try:
+        i = template.stat_names.index(stat)
+    except ValueError:
+        return None
+    return template.stat_codec.unpack(packed_stats)[i]
+
+class CardSearchIndex:
+    """
+    Inverted index over every claimed card, for /search.
+
+    Each card gets a document id in claim order. Words map to ascending lists of
+    document ids, serial numbers are kept sorted for prefix lookups, and each stat
+    keeps a sorted list of (value, document id) for range queries. Everything is
+    appended to as cards are claimed, so the index never needs a rebuild.
+
+    Documents keep a card's position in its owner's list and the fields searches
+    filter on (its serial number, shared template and packed stats), not the Card,
+    so the index doesn't hold every collection in memory.
+    """
+
+    def __init__(self):
+        # document id -> (user_key, position in the user's list, serial number, template, packed stats)
+        self.docs = []
+        self.postings = {}  # token -> ascending document ids
+        self.serials = []  # sorted (upper-case serial, document id)
+        self.stats = {}  # stat name -> sorted (value, document id)
+
+    def build(self, collections) -> None:
+        """Index every card in one pass, given (user_key, cards) pairs such as collections.items()."""
+        for user_key, user_cards in collections:
+            self.extend(user_key, user_cards)
+        self.finish()
+
+    def extend(self, user_key: str, user_cards: list) -> None:
+        """Index one user's cards as part of a build; call finish() once every user is in."""
+        for pos, card in enumerate(user_cards):
+            doc_id = self._add_document(user_key, pos, card)
+            self.serials.append((card.serial_number.upper(), doc_id))
+            for stat, value in zip(card.template.stat_names, card.stat_values):
+                self.stats.setdefault(stat, []).append((value, doc_id))
+
+    def finish(self) -> None:
+        # Sort once at the end of a build instead of inserting every entry in order.
+        self.serials.sort()
+        for entries in self.stats.values():
+            entries.sort()
+
+    def has_serial(self, serial_number: str) -> bool:
+        serial = serial_number.upper()
+        i = bisect.bisect_left(self.serials, (serial, -1))
+        return i < len(self.serials) and self.serials[i][0] == serial
+
+    def add(self, user_key: str, pos: int, card) -> None:
+        """Index a newly claimed card."""
+        doc_id = self._add_document(user_key, pos, card)
+        bisect.insort(self.serials, (card.serial_number.upper(), doc_id))
+        for stat, value in zip(card.template.stat_names, card.stat_values):
+            bisect.insort(self.stats.setdefault(stat, []), (value, doc_id))
+
+    def _add_document(self, user_key: str, pos: int, card) -> int:
+        doc_id = len(self.docs)
+        self.docs.append((user_key, pos, card.serial_number, card.template, card.packed_stats))
+        for token in card_tokens(user_key, card):
+            self.postings.setdefault(token, []).append(doc_id)
+        return doc_id
+
+    def _parse_term(self, term: str):
+        """
+        Turn one query word into (estimated matches, matching document ids, predicate),
+        where the predicate checks one document given its id and its self.docs entry.
+        """
+        match = _RANGE_TERM.match(term)
+        if match:
+            stat_name, op, number = match.groups()
+            stat = STAT_ALIASES.get(stat_name)
+            if stat is None:
+                raise ValueError(f"Unknown stat in '{term}'.")
+            number = int(number)
+            low, high = {
+                ">=": (number, None), ">": (number + 1, None),
+                "<=": (None, number), "<": (None, number - 1),
+                "=": (number, number)
+            }[op]
+            entries = self.stats.get(stat, [])
+            start = 0 if low is None else bisect.bisect_left(entries, (low, -1))
+            end = len(entries) if high is None else bisect.bisect_left(entries, (high + 1, -1))
+
+            def in_range(doc_id, doc):
+                value = _doc_stat(doc, stat)
+                return value is not None and (low is None or value >= low) and (high is None or value <= high)
+            return end - start, (doc_id for _, doc_id in entries[start:end]), in_range
+
+        field, _, value = term.rpartition(":")
+        if field == "serial":
+            prefix = value.upper()
+            start = bisect.bisect_left(self.serials, (prefix, -1))
+            end = bisect.bisect_left(self.serials, (prefix + "\uffff", -1))
+            return (end - start, (doc_id for _, doc_id in self.serials[start:end]),
+                    lambda doc_id, doc: doc[2].upper().startswith(prefix))
+        if field == "owner":
+            docs = self.postings.get(term, [])
+            return len(docs), docs, lambda doc_id, doc: doc[0] == value
+        if field and field not in TEXT_FIELDS:
+            raise ValueError(f"Unknown search field '{field}'.")
+
+        words = _words(value)
+        if len(words) != 1:
+            raise ValueError(f"Could not understand '{term}'.")
+        token = f"{field}:{words[0]}" if field else words[0]
+        docs = self.postings.get(token, [])
+
+        def has_token(doc_id, doc):
+            # Postings are in ascending document order, so membership is a binary search.
+            i = bisect.bisect_left(docs, doc_id)
+            return i < len(docs) and docs[i] == doc_id
+        return len(docs), docs, has_token
+
+    def search(self, query: str, owner: str = None, limit: int = 15):
+        """
+        Return (total matches, first `limit` matches as (user_key, position, serial number, name)).
+
+        The query is a list of space-separated terms that must all match: plain words
+        (matched against name, set, rarity and variant), field:word, serial:PREFIX and
+        stat ranges such as shoot>=90 or spd<50. owner restricts results to one user.
+        """
+        terms = [self._parse_term(term) for term in query.lower().split()]
+        if not terms:
+            raise ValueError("Please enter something to search for.")
+        if owner is not None:
+            terms.append(self._parse_term(f"owner:{owner}"))
+
+        # Only walk the most selective term; check the others against each candidate.
+        terms.sort(key=lambda term: term[0])
+        _, candidates, _ = terms[0]
+        checks = [predicate for _, _, predicate in terms[1:]]
+
+        matches = []
+        for doc_id in sorted(candidates):
+            doc = self.docs[doc_id]
+            if all(check(doc_id, doc) for check in checks):
+                matches.append(doc)
+        return len(matches), [(user_key, pos, serial, template.name) for user_key, pos, serial, template, _
+                              in matches[:limit]]
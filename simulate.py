@@ -0,0 +1,164 @@
+"""
+Offline drop economy simulator.
+
+Runs simulated drops against the same CARD_TEMPLATES and alias-method sampler
+the bot uses, and reports:
+  - drop rates per rarity and per template (configured vs simulated),
+  - how far serial numbers get per serial prefix after a number of drops,
+  - how many claims (and drops) a collector needs to complete each set.
+
+Usage: python simulate.py [--drops N] [--trials N] [--collectors N] [--seed N] ...
+Requires NumPy.
+"""
+import sys
+import time
+import argparse
+from collections import defaultdict
+import card_database
+from card_database import get_sampler, serial_prefix
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Templates drawn per sampler call; bounds memory use for very long runs.
+DRAW_CHUNK = 1 << 20
+# Draws simulated per collector at a time when timing set completion.
+COMPLETION_BLOCK = 1024
+# Percentiles reported for distributions.
+PERCENTILES = (5, 50, 95)
+
+def draw_counts(sampler, drops: int, generator) -> "np.ndarray":
+    """Number of times each template is drawn in `drops` drops."""
+    counts = np.zeros(sampler.size, dtype=np.int64)
+    for start in range(0, drops, DRAW_CHUNK):
+        indexes = sampler.draw_indices(min(DRAW_CHUNK, drops - start), generator)
+        counts += np.bincount(indexes, minlength=sampler.size)
+    return counts
+
+def simulate_serials(sampler, drops: int, trials: int, generator) -> tuple:
+    """
+    Run `trials` independent economies of `drops` drops each. Returns (template
+    counts of every trial as a trials x templates array, serial prefix per template).
+    """
+    prefixes = [serial_prefix(t["name"], t["rarity"], t["set"]) for t in sampler.templates]
+    counts = np.stack([draw_counts(sampler, drops, generator) for _ in range(trials)])
+    return counts, prefixes
+
+def simulate_completion(sampler, targets: list, collectors: int, max_claims: int, generator) -> "np.ndarray":
+    """
+    Claims each of `collectors` independent collectors makes until they own at
+    least one card of every template index in targets. Collectors still missing
+    a template after max_claims claims get -1.
+    """
+    targets = np.asarray(targets)
+    first_seen = np.full((collectors, len(targets)), -1, dtype=np.int64)
+    done = np.zeros(collectors, dtype=bool)
+    claimed = 0
+    while claimed < max_claims and not done.all():
+        active = np.flatnonzero(~done)
+        block = min(COMPLETION_BLOCK, max_claims - claimed)
+        draws = sampler.draw_indices(len(active) * block, generator).reshape(len(active), block)
+        for column, template in enumerate(targets):
+            missing = first_seen[active, column] < 0
+            if not missing.any():
+                continue
+            hits = draws[missing] == template
+            found = hits.any(axis=1)
+            rows = active[missing][found]
+            first_seen[rows, column] = claimed + hits[found].argmax(axis=1) + 1
+        claimed += block
+        done = (first_seen >= 0).all(axis=1)
+    result = first_seen.max(axis=1)
+    result[~done] = -1
+    return result
+
+def format_percentiles(values) -> str:
+    return " / ".join(f"{value:,.0f}" for value in np.percentile(values, PERCENTILES))
+
+def report_rates(sampler, counts: "np.ndarray") -> None:
+    templates = sampler.templates
+    weights = np.array([t.get("drop_weight", 1) for t in templates], dtype=float)
+    expected = weights / weights.sum()
+    simulated = counts.sum(axis=0) / counts.sum()
+
+    print("\nDrop rates by rarity (configured vs simulated):")
+    by_rarity = defaultdict(list)
+    for i, template in enumerate(templates):
+        by_rarity[template["rarity"]].append(i)
+    for rarity in sorted(by_rarity, key=lambda r: -expected[by_rarity[r]].sum()):
+        rows = by_rarity[rarity]
+        print(f"  {rarity:<12} {expected[rows].sum():>9.4%} {simulated[rows].sum():>9.4%}"
+              f"   1 in {1 / expected[rows].sum():,.1f} drops")
+
+    print("\nDrop rates by template (configured vs simulated):")
+    for i, template in enumerate(templates):
+        label = f"{template['name']} ({template.get('variant', '-')}, {template['set']}, {template['rarity']})"
+        print(f"  {label:<55} {expected[i]:>9.4%} {simulated[i]:>9.4%}")
+
+def report_serials(counts: "np.ndarray", prefixes: list, drops: int) -> None:
+    # Templates can share a prefix (e.g. variants of one character), so sum them per prefix.
+    by_prefix = defaultdict(list)
+    for i, prefix in enumerate(prefixes):
+        by_prefix[prefix].append(i)
+    trials = counts.shape[0]
+    print(f"\nHighest serial number per prefix after {drops:,} drops "
+          f"(p{PERCENTILES[0]} / p{PERCENTILES[1]} / p{PERCENTILES[2]} over {trials} trials):")
+    for prefix in sorted(by_prefix, key=lambda p: -counts[:, by_prefix[p]].sum()):
+        per_trial = counts[:, by_prefix[prefix]].sum(axis=1)
+        print(f"  {prefix:<16} {format_percentiles(per_trial)}")
+
+def report_completion(sampler, collectors: int, max_claims: int, claim_share: float, generator) -> None:
+    by_set = defaultdict(list)
+    for i, template in enumerate(sampler.templates):
+        by_set[template["set"]].append(i)
+    print(f"\nClaims needed to own every template in a set "
+          f"(p{PERCENTILES[0]} / p{PERCENTILES[1]} / p{PERCENTILES[2]} over {collectors:,} collectors"
+          f"{f'; drops assume the collector claims {claim_share:.0%} of them' if claim_share < 1 else ''}):")
+    for card_set, targets in by_set.items():
+        claims = simulate_completion(sampler, targets, collectors, max_claims, generator)
+        finished = claims[claims >= 0]
+        line = f"  {card_set:<22} ({len(targets)} templates) "
+        if len(finished) == 0:
+            print(line + f"nobody finished within {max_claims:,} claims")
+            continue
+        line += f"claims {format_percentiles(finished)}"
+        if claim_share < 1:
+            line += f"   drops {format_percentiles(finished / claim_share)}"
+        if len(finished) < collectors:
+            line += f"   ({collectors - len(finished):,} unfinished after {max_claims:,} claims)"
+        print(line)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Simulate drops against the live card templates.")
+    parser.add_argument("--drops", type=int, default=1_000_000, help="drops per simulated economy")
+    parser.add_argument("--trials", type=int, default=20, help="independent economies for serial ranges")
+    parser.add_argument("--collectors", type=int, default=2000, help="collectors simulated for set completion")
+    parser.add_argument("--max-claims", type=int, default=1_000_000,
+                        help="give up on a collector's set after this many claims")
+    parser.add_argument("--claim-share", type=float, default=1.0,
+                        help="fraction of all drops one collector claims (to convert claims to drops)")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible runs")
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print("The simulator needs NumPy: pip install numpy")
+        return 1
+    if not 0 < args.claim_share <= 1:
+        parser.error("--claim-share must be in (0, 1]")
+
+    generator = np.random.default_rng(args.seed)
+    sampler = get_sampler()
+    print(f"{sampler.size} templates from {card_database.__file__}")
+
+    started = time.perf_counter()
+    counts, prefixes = simulate_serials(sampler, args.drops, args.trials, generator)
+    report_rates(sampler, counts)
+    report_serials(counts, prefixes, args.drops)
+    report_completion(sampler, args.collectors, args.max_claims, args.claim_share, generator)
+    print(f"\nSimulated {args.drops * args.trials:,} drops and {args.collectors:,} collectors per set "
+          f"in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,990 @@
+import os
+import sys
+import json
+import time
+import zlib
+import asyncio
+import sqlite3
+import threading
+import itertools
+import metrics
+import persistence
+import json_stream
+from abc import ABC, abstractmethod
+from card_model import card_to_dict
+
+# Which backend stores user collections: "sqlite" (default), "sharded" or "json".
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+# SQLite database file used by the sqlite backend.
+DATABASE_FILE = os.getenv("DATABASE_FILE", "collections.db")
+# The JSON file used by the json backend, and the source for the one-shot migration.
+COLLECTION_FILENAME = "collections.json"
+# Directory holding the sharded backend's index and shard files.
+SHARD_DIR = os.getenv("SHARD_DIR", "shards")
+# Number of shards a new sharded layout is split into (an existing layout keeps its own).
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "256"))
+# Buffer claims in memory and write them in the background ("0" writes each claim through).
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "1") != "0"
+# Maximum seconds a claimed card waits in memory before it is flushed.
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "2"))
+# Number of pending cards that triggers a flush before the interval is up.
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "50"))
+# Failed flushes of a batch before its cards are written one by one to find the bad ones
+# (errors that say the store itself is unavailable are retried for as long as they last).
+WRITE_BEHIND_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", "3"))
+# Where cards that could not be written even on their own are kept, one JSON object per line.
+QUARANTINE_FILE = os.getenv("QUARANTINE_FILE", "quarantined_cards.jsonl")
+
+class CollectionStore(ABC):
+    """
+    Repository interface for user collections and serial counters. Backends must
+    implement the abstract methods; the rest have working defaults built on them.
+
+    Cards are loaded in the same dict shape that collections.json uses:
+    {"serial_number", "name", "set", "rarity", "stats"} plus an optional "variant".
+    Cards handed back to a store may be those dicts or card_model.Card objects;
+    they are converted with card_to_dict when written.
+    """
+
+    @abstractmethod
+    def load_collections(self) -> dict:
+        """Return a mapping of user_id (str) to that user's list of card dicts."""
+
+    def iter_collections(self):
+        """Yield (user_id, list of card dicts) for every user, one user at a time."""
+        yield from self.load_collections().items()
+
+    def load_user(self, user_key: str) -> list:
+        """Return one user's list of card dicts (empty if they have none)."""
+        return self.load_collections().get(user_key, [])
+
+    @abstractmethod
+    def save_collections(self, collections: dict) -> None:
+        """Replace everything in the store with the given collections."""
+
+    @abstractmethod
+    def add_card(self, user_key: str, card_data: dict) -> None:
+        """Persist a card newly added to the end of the user's collection."""
+
+    def add_cards(self, batch: dict) -> None:
+        """Persist several pending cards at once, given as user_id -> list of card dicts."""
+        for user_key, cards in batch.items():
+            for card_data in cards:
+                self.add_card(user_key, card_data)
+
+    def discard_unsaved(self, user_key: str, serials: set) -> None:
+        """Forget cards (by serial number) that were handed to add_cards but are still buffered unwritten."""
+        pass
+
+    @abstractmethod
+    def allocate_serial_number(self, prefix: str) -> int:
+        """Reserve and return the next serial number for a serial prefix."""
+
+    def allocate_serial_blocks(self, block_sizes: dict) -> dict:
+        """
+        Reserve a block of consecutive serial numbers for each prefix in block_sizes
+        (prefix -> how many); returns prefix -> first number of its block.
+        """
+        first_numbers = {}
+        for prefix, size in block_sizes.items():
+            numbers = [self.allocate_serial_number(prefix) for _ in range(size)]
+            first_numbers[prefix] = numbers[0]
+        return first_numbers
+
+    def start(self) -> None:
+        """Start any background work; called from the running event loop."""
+        pass
+
+    async def shutdown(self) -> None:
+        """Stop background work and close the store."""
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+def _replace_file(tmp_path: str, path: str) -> None:
+    # Swap in a complete, fsynced file so a crash mid-write cannot corrupt the collections.
+    os.replace(tmp_path, path)
+    if hasattr(os, "O_DIRECTORY"):
+        # Make the rename itself durable (not supported on Windows).
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def _write_json_file(path: str, data) -> None:
+    """Atomically replace path with data as JSON (Cards are written in their dict shape)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4, default=card_to_dict)
+        f.flush()
+        os.fsync(f.fileno())
+        metrics.storage_bytes.inc("written", amount=os.fstat(f.fileno()).st_size)
+    _replace_file(tmp_path, path)
+
+def _serial_number(card) -> str:
+    return card["serial_number"] if isinstance(card, dict) else card.serial_number
+
+def _merge_cards(stored: list, unsaved: list) -> list:
+    """
+    Append cards that were not yet written to a user's stored cards. An unsaved
+    card may have been written after the stored cards were read, so skip serial
+    numbers that are already there.
+    """
+    if not unsaved:
+        return stored
+    serials = {card["serial_number"] for card in stored}
+    return stored + [card for card in unsaved if card["serial_number"] not in serials]
+
+class JsonCollectionStore(CollectionStore):
+    """
+    The original layout: one collections.json plus card_counts.json for serial counters.
+
+    The file is never loaded whole. The first access scans it once, streaming, to
+    note where each user's cards are; after that a user's cards are read and parsed
+    on their own. New cards are written by streaming the old file into a new one,
+    copying untouched users byte for byte.
+    """
+
+    name = "json"
+
+    def __init__(self, path: str = COLLECTION_FILENAME):
+        self.path = path
+        self.offsets = None  # user_id -> (start, end) byte offsets of the user's cards; scanned on first use
+        self.unsaved = {}  # user_id -> cards added since the file was last written
+        self.card_counts = None
+        self.lock = threading.Lock()  # Guards offsets/unsaved and swapping in a new file.
+        self.write_lock = threading.Lock()  # One rewrite at a time.
+
+    def _scan(self) -> None:
+        offsets = {}
+        try:
+            metrics.storage_bytes.inc("read", amount=os.path.getsize(self.path))
+            for user_key, _, start, end in json_stream.iter_object(self.path):
+                offsets[user_key] = (start, end)
+        except FileNotFoundError:
+            pass
+        self.offsets = offsets
+
+    def load_collections(self) -> dict:
+        return dict(self.iter_collections())
+
+    def iter_collections(self):
+        with self.lock:
+            unsaved = {user_key: list(cards) for user_key, cards in self.unsaved.items()}
+        try:
+            # A rewrite replaces the file rather than changing it, so this keeps reading the old one.
+            metrics.storage_bytes.inc("read", amount=os.path.getsize(self.path))
+            for user_key, cards, _, _ in json_stream.iter_object(self.path):
+                yield user_key, _merge_cards(cards, [card_to_dict(card) for card in unsaved.pop(user_key, [])])
+        except FileNotFoundError:
+            pass
+        for user_key, cards in unsaved.items():
+            yield user_key, [card_to_dict(card) for card in cards]
+
+    def load_user(self, user_key: str) -> list:
+        with self.lock:
+            if self.offsets is None:
+                self._scan()
+            span = self.offsets.get(user_key)
+            cards = json_stream.read_value(self.path, *span) if span else []
+            if span:
+                metrics.storage_bytes.inc("read", amount=span[1] - span[0])
+            return cards + [card_to_dict(card) for card in self.unsaved.get(user_key, [])]
+
+    def save_collections(self, collections: dict) -> None:
+        with self.write_lock:
+            self._write_file(collections)
+            with self.lock:
+                self.offsets = None
+                self.unsaved = {}
+
+    def _write_file(self, collections: dict) -> None:
+        _write_json_file(self.path, collections)
+
+    def _replace(self, tmp_path: str) -> None:
+        _replace_file(tmp_path, self.path)
+
+    def add_card(self, user_key: str, card_data) -> None:
+        self.add_cards({user_key: [card_data]})
+
+    def add_cards(self, batch: dict) -> None:
+        with self.lock:
+            for user_key, cards in batch.items():
+                pending = self.unsaved.setdefault(user_key, [])
+                # A batch retried after a failed rewrite is already pending.
+                serials = {_serial_number(card) for card in pending}
+                pending.extend(card for card in cards if _serial_number(card) not in serials)
+        # This layout can only persist new cards by rewriting the file; one rewrite covers the batch.
+        self._rewrite()
+
+    def discard_unsaved(self, user_key: str, serials: set) -> None:
+        # A card left in unsaved would be written by the next rewrite (or fail it again).
+        with self.write_lock, self.lock:
+            cards = self.unsaved.get(user_key)
+            if cards:
+                cards[:] = [card for card in cards if _serial_number(card) not in serials]
+                if not cards:
+                    del self.unsaved[user_key]
+
+    def _rewrite(self) -> None:
+        """Write the file again with every unsaved card, streaming from the current file."""
+        with self.write_lock:
+            with self.lock:
+                if self.offsets is None:
+                    self._scan()
+                offsets = self.offsets
+                unsaved = {user_key: list(cards) for user_key, cards in self.unsaved.items()}
+            if not unsaved:
+                return
+
+            new_offsets = {}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as out:
+                out.write(b"{")
+
+                def write_member(user_key: str, body: bytes) -> None:
+                    # Same layout as json.dump(collections, indent=4).
+                    out.write(b"\n    " if not new_offsets else b",\n    ")
+                    out.write(json.dumps(user_key).encode("utf-8") + b": ")
+                    start = out.tell()
+                    out.write(body)
+                    new_offsets[user_key] = (start, out.tell())
+
+                def dump_cards(cards: list) -> bytes:
+                    text = json.dumps([card_to_dict(card) for card in cards], indent=4)
+                    return text.replace("\n", "\n    ").encode("utf-8")
+
+                if offsets:
+                    with open(self.path, "rb") as old:
+                        for user_key, (start, end) in offsets.items():
+                            old.seek(start)
+                            body = old.read(end - start)
+                            if user_key in unsaved:
+                                # Skip cards a failed rewrite already got into the file's user list.
+                                added = [card_to_dict(card) for card in unsaved[user_key]]
+                                body = dump_cards(_merge_cards(json.loads(body), added))
+                            write_member(user_key, body)
+                        metrics.storage_bytes.inc("read", amount=old.tell())
+                for user_key, cards in unsaved.items():
+                    if user_key not in new_offsets:
+                        write_member(user_key, dump_cards(cards))
+                out.write(b"\n}" if new_offsets else b"}")
+                out.flush()
+                os.fsync(out.fileno())
+                metrics.storage_bytes.inc("written", amount=out.tell())
+
+            with self.lock:
+                self._replace(tmp_path)
+                self.offsets = new_offsets
+                # Keep only cards added while the file was being written.
+                for user_key, cards in unsaved.items():
+                    del self.unsaved[user_key][:len(cards)]
+                    if not self.unsaved[user_key]:
+                        del self.unsaved[user_key]
+
+    def _counts(self) -> dict:
+        if self.card_counts is None:
+            self.card_counts = persistence.load_or_rebuild_card_counts(
+                cards for _, cards in self.iter_collections()
+            )
+        return self.card_counts
+
+    def allocate_serial_number(self, prefix: str) -> int:
+        return persistence.allocate_serial_number(self._counts(), prefix)
+
+    def allocate_serial_blocks(self, block_sizes: dict) -> dict:
+        return persistence.allocate_serial_blocks(self._counts(), block_sizes)
+
+# Name of the sharded layout's index inside SHARD_DIR.
+SHARD_INDEX_FILE = "index.json"
+
+def shard_of(user_key: str, shard_count: int) -> int:
+    """The shard a user's cards live in (stable across runs, unlike hash())."""
+    return zlib.crc32(user_key.encode("utf-8")) % shard_count
+
+class ShardedJsonCollectionStore(CollectionStore):
+    """
+    Collections spread over hash-bucketed JSON files, so a claim only rewrites the
+    one shard holding that user instead of everyone's cards.
+
+    Each user belongs to shard shard_of(user_id, shard_count). Shard files have the
+    same user_id -> cards shape as collections.json. index.json records the layout
+    (shard count and shard file names); it is written once when the layout is
+    created and is what marks a directory as a complete sharded store. Shards are
+    replaced atomically, so readers always see a whole shard. Serial counters live
+    in card_counts.json, as with the json backend.
+    """
+
+    name = "sharded"
+
+    def __init__(self, directory: str = SHARD_DIR, shard_count: int = SHARD_COUNT):
+        self.directory = directory
+        self.card_counts = None
+        self.lock = threading.Lock()  # One shard rewrite at a time.
+        index = read_shard_index(directory)
+        if index is None:
+            os.makedirs(directory, exist_ok=True)
+            index = _write_shard_index(directory, shard_count)
+        self.shard_count = index["shard_count"]
+        self.shard_files = index["shards"]
+
+    def _shard_path(self, shard: int) -> str:
+        return os.path.join(self.directory, self.shard_files[shard])
+
+    def _read_shard(self, shard: int) -> dict:
+        try:
+            with open(self._shard_path(shard), "r") as f:
+                metrics.storage_bytes.inc("read", amount=os.fstat(f.fileno()).st_size)
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def load_collections(self) -> dict:
+        return dict(self.iter_collections())
+
+    def iter_collections(self):
+        for shard in range(self.shard_count):
+            yield from self._read_shard(shard).items()
+
+    def load_user(self, user_key: str) -> list:
+        return self._read_shard(shard_of(user_key, self.shard_count)).get(user_key, [])
+
+    def save_collections(self, collections: dict) -> None:
+        shards = [{} for _ in range(self.shard_count)]
+        for user_key, cards in collections.items():
+            shards[shard_of(user_key, self.shard_count)][user_key] = cards
+        with self.lock:
+            for shard, data in enumerate(shards):
+                _write_json_file(self._shard_path(shard), data)
+
+    def add_card(self, user_key: str, card_data) -> None:
+        self.add_cards({user_key: [card_data]})
+
+    def add_cards(self, batch: dict) -> None:
+        by_shard = {}
+        for user_key, cards in batch.items():
+            by_shard.setdefault(shard_of(user_key, self.shard_count), {})[user_key] = cards
+        with self.lock:
+            # Read, extend and atomically replace only the shards that gained cards. A batch
+            # retried after a failed write may already be in the shards written before it.
+            for shard, users in by_shard.items():
+                data = self._read_shard(shard)
+                for user_key, cards in users.items():
+                    data[user_key] = _merge_cards(data.get(user_key, []), [card_to_dict(card) for card in cards])
+                _write_json_file(self._shard_path(shard), data)
+
+    def _counts(self) -> dict:
+        if self.card_counts is None:
+            self.card_counts = persistence.load_or_rebuild_card_counts(
+                cards for _, cards in self.iter_collections()
+            )
+        return self.card_counts
+
+    def allocate_serial_number(self, prefix: str) -> int:
+        return persistence.allocate_serial_number(self._counts(), prefix)
+
+    def allocate_serial_blocks(self, block_sizes: dict) -> dict:
+        return persistence.allocate_serial_blocks(self._counts(), block_sizes)
+
+def read_shard_index(directory: str = SHARD_DIR):
+    """Return the sharded layout's index, or None if the directory has no complete layout."""
+    try:
+        with open(os.path.join(directory, SHARD_INDEX_FILE), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_shard_index(directory: str, shard_count: int) -> dict:
+    index = {
+        "version": 1,
+        "hash": "crc32",
+        "shard_count": shard_count,
+        "shards": [f"shard-{shard:04d}.json" for shard in range(shard_count)]
+    }
+    _write_json_file(os.path.join(directory, SHARD_INDEX_FILE), index)
+    return index
+
+def split_collections(json_path: str = COLLECTION_FILENAME, directory: str = SHARD_DIR,
+                      shard_count: int = SHARD_COUNT) -> int:
+    """
+    Split a monolithic collections.json into a sharded layout, streaming it one user
+    at a time with every shard file open for writing. The index is written last, so
+    an interrupted split is simply redone. Returns the number of users split.
+    The JSON file is left untouched as a backup.
+    """
+    if read_shard_index(directory) is not None:
+        raise ValueError(f"{directory} already holds a sharded layout")
+    os.makedirs(directory, exist_ok=True)
+    names = [f"shard-{shard:04d}.json" for shard in range(shard_count)]
+    tmp_paths = [os.path.join(directory, name + ".tmp") for name in names]
+    files = [open(path, "w") for path in tmp_paths]
+    written = [0] * shard_count
+    try:
+        for user_key, cards, _, _ in json_stream.iter_object(json_path):
+            shard = shard_of(user_key, shard_count)
+            f = files[shard]
+            # Same layout as json.dump(..., indent=4) of the shard's mapping.
+            f.write("{\n    " if written[shard] == 0 else ",\n    ")
+            f.write(json.dumps(user_key) + ": " + json.dumps(cards, indent=4).replace("\n", "\n    "))
+            written[shard] += 1
+        for shard, f in enumerate(files):
+            f.write("\n}" if written[shard] else "{}")
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        for f in files:
+            f.close()
+    for tmp_path, name in zip(tmp_paths, names):
+        _replace_file(tmp_path, os.path.join(directory, name))
+    _write_shard_index(directory, shard_count)
+    return sum(written)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    card_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL REFERENCES users(user_id),
+    serial_number TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    card_set TEXT NOT NULL,
+    rarity TEXT NOT NULL,
+    variant TEXT,
+    stats TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cards_by_user ON cards(user_id, id);
+CREATE TABLE IF NOT EXISTS serial_counters (
+    prefix TEXT PRIMARY KEY,
+    last_number INTEGER NOT NULL
+);
+"""
+
+class SqliteCollectionStore(CollectionStore):
+    """
+    SQLite (WAL mode) backend. A claim inserts one row in its own transaction, so
+    write cost no longer depends on how many cards everyone owns.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = DATABASE_FILE):
+        self.path = path
+        # Shared between the event loop and executor threads, guarded by our own lock.
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(_SCHEMA)
+
+    def _insert_cards(self, user_key: str, cards: list, ignore_duplicates: bool = False) -> int:
+        """Insert cards for one user inside the caller's transaction; returns rows added."""
+        verb = "INSERT OR IGNORE" if ignore_duplicates else "INSERT"
+        self.conn.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_key,))
+        before = self.conn.total_changes
+        self.conn.executemany(
+            f"{verb} INTO cards (user_id, serial_number, name, card_set, rarity, variant, stats) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (user_key, card["serial_number"], card["name"], card["set"], card["rarity"],
+                 card.get("variant"), json.dumps(card["stats"]))
+                for card in map(card_to_dict, cards)
+            ]
+        )
+        added = self.conn.total_changes - before
+        self.conn.execute(
+            "UPDATE users SET card_count = card_count + ? WHERE user_id = ?",
+            (added, user_key)
+        )
+        return added
+
+    @staticmethod
+    def _row_to_card(row) -> dict:
+        serial_number, name, card_set, rarity, variant, stats = row
+        card = {
+            "serial_number": serial_number,
+            "name": name,
+            "set": card_set,
+            "rarity": rarity,
+            "stats": json.loads(stats)
+        }
+        if variant is not None:
+            card["variant"] = variant
+        return card
+
+    def load_collections(self) -> dict:
+        return dict(self.iter_collections())
+
+    def iter_collections(self, users_per_query: int = 500):
+        with self.lock:
+            user_keys = [row[0] for row in self.conn.execute("SELECT user_id FROM users ORDER BY user_id")]
+        # Fetch a range of users per query, without holding the lock while the caller works.
+        for i in range(0, len(user_keys), users_per_query):
+            first, last = user_keys[i], user_keys[min(i + users_per_query, len(user_keys)) - 1]
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT user_id, serial_number, name, card_set, rarity, variant, stats "
+                    "FROM cards WHERE user_id BETWEEN ? AND ? ORDER BY user_id, id",
+                    (first, last)
+                ).fetchall()
+            for user_key, user_rows in itertools.groupby(rows, key=lambda row: row[0]):
+                yield user_key, [self._row_to_card(row[1:]) for row in user_rows]
+
+    def load_user(self, user_key: str) -> list:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT serial_number, name, card_set, rarity, variant, stats "
+                "FROM cards WHERE user_id = ? ORDER BY id",
+                (user_key,)
+            ).fetchall()
+        return [self._row_to_card(row) for row in rows]
+
+    def save_collections(self, collections: dict) -> None:
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM cards")
+                self.conn.execute("DELETE FROM users")
+                for user_key, user_cards in collections.items():
+                    self._insert_cards(user_key, user_cards)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def add_card(self, user_key: str, card_data: dict) -> None:
+        self.add_cards({user_key: [card_data]})
+
+    def add_cards(self, batch: dict) -> None:
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for user_key, cards in batch.items():
+                    self._insert_cards(user_key, cards)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def allocate_serial_number(self, prefix: str) -> int:
+        with self.lock:
+            row = self.conn.execute(
+                "INSERT INTO serial_counters (prefix, last_number) VALUES (?, 1) "
+                "ON CONFLICT(prefix) DO UPDATE SET last_number = last_number + 1 "
+                "RETURNING last_number",
+                (prefix,)
+            ).fetchone()
+        return row[0]
+
+    def allocate_serial_blocks(self, block_sizes: dict) -> dict:
+        first_numbers = {}
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for prefix, size in block_sizes.items():
+                    row = self.conn.execute(
+                        "INSERT INTO serial_counters (prefix, last_number) VALUES (?, ?) "
+                        "ON CONFLICT(prefix) DO UPDATE SET last_number = last_number + excluded.last_number "
+                        "RETURNING last_number",
+                        (prefix, size)
+                    ).fetchone()
+                    first_numbers[prefix] = row[0] - size + 1
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return first_numbers
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM cards LIMIT 1").fetchone() is None
+
+    def close(self) -> None:
+        with self.lock:
+            # Fold the WAL back into the database file so everything is on disk.
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+
+# Errors from a store that is unavailable as a whole (full disk, locked database) rather
+# than unable to take particular cards; write-behind keeps retrying those batches.
+TRANSIENT_ERRORS = (OSError, sqlite3.OperationalError)
+
+class WriteBehindStore(CollectionStore):
+    """
+    Wraps another store so claims return at memory speed.
+
+    add_card only queues the card (the caller has already updated the in-memory
+    collections). A background task flushes everything queued, coalesced per user,
+    through a thread executor every WRITE_BEHIND_INTERVAL seconds or as soon as
+    WRITE_BEHIND_BATCH cards are waiting. Shutdown flushes what is left and closes
+    the inner store. Serial allocation is written through immediately, so a crash
+    can lose at most the last interval of claims, never reuse a serial number.
+
+    A batch that fails WRITE_BEHIND_RETRIES flushes in a row with something other
+    than TRANSIENT_ERRORS (or fails at all at shutdown) is written one card at a
+    time; cards that still fail are moved to QUARANTINE_FILE so they stop blocking
+    everything queued behind them. start() writes quarantined cards back, so cards
+    set aside while the store was down at shutdown return on the next run.
+    """
+
+    def __init__(self, inner: CollectionStore, interval: float = WRITE_BEHIND_INTERVAL,
+                 batch_size: int = WRITE_BEHIND_BATCH):
+        self.inner = inner
+        self.interval = interval
+        self.batch_size = max(batch_size, 1)
+        self.pending = {}  # user_id -> cards not yet written
+        self.pending_count = 0
+        self.in_flight = {}  # user_id -> cards being written by the current flush
+        self.failures = 0  # Failed flushes in a row of the batch at the front of pending.
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # One flush at a time.
+        self._wakeup = None
+        self._task = None
+
+    def load_collections(self) -> dict:
+        return dict(self.iter_collections())
+
+    def _queued(self) -> dict:
+        """Cards not yet known to be written, per user, as card dicts."""
+        with self.lock:
+            queued = {}
+            for cards_by_user in (self.in_flight, self.pending):
+                for user_key, cards in cards_by_user.items():
+                    queued.setdefault(user_key, []).extend(card_to_dict(card) for card in cards)
+            return queued
+
+    def iter_collections(self):
+        queued = self._queued()
+        for user_key, cards in self.inner.iter_collections():
+            yield user_key, _merge_cards(cards, queued.pop(user_key, []))
+        yield from queued.items()
+
+    def load_user(self, user_key: str) -> list:
+        queued = self._queued().get(user_key, [])
+        return _merge_cards(self.inner.load_user(user_key), queued)
+
+    def save_collections(self, collections: dict) -> None:
+        with self.flush_lock:
+            with self.lock:
+                self.pending, self.pending_count = {}, 0
+            self.inner.save_collections(collections)
+
+    def add_card(self, user_key: str, card_data: dict) -> None:
+        if self._task is None:
+            # No flusher running (e.g. scripts): write through.
+            self.inner.add_card(user_key, card_data)
+            return
+        with self.lock:
+            self.pending.setdefault(user_key, []).append(card_data)
+            self.pending_count += 1
+            full = self.pending_count >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def allocate_serial_number(self, prefix: str) -> int:
+        return self.inner.allocate_serial_number(prefix)
+
+    def allocate_serial_blocks(self, block_sizes: dict) -> dict:
+        return self.inner.allocate_serial_blocks(block_sizes)
+
+    def flush(self, isolate: bool = False) -> int:
+        """
+        Write every pending card through the inner store; returns how many were written.
+        With isolate (or once the batch has failed WRITE_BEHIND_RETRIES times) a failed
+        batch is retried card by card instead of being queued again.
+        """
+        with self.flush_lock:
+            with self.lock:
+                batch, count = self.pending, self.pending_count
+                self.pending, self.pending_count = {}, 0
+                self.in_flight = batch
+            if not batch:
+                return 0
+            try:
+                self.inner.add_cards(batch)
+            except Exception as e:
+                transient = isinstance(e, TRANSIENT_ERRORS)
+                if not transient:
+                    self.failures += 1
+                if not isolate and (transient or self.failures < WRITE_BEHIND_RETRIES):
+                    # Put the batch back in front of anything queued meanwhile and retry later.
+                    self._requeue(batch, count)
+                    raise
+                print(f"Flushing {count} cards failed ({e}); writing them one at a time")
+                quarantined, retry = self._write_each(batch, final=isolate)
+                retried = sum(map(len, retry.values()))
+                if retry:
+                    self._requeue(retry, retried)
+                count -= quarantined + retried
+            self.failures = 0
+            with self.lock:
+                self.in_flight = {}
+            return count
+
+    def _requeue(self, batch: dict, count: int) -> None:
+        with self.lock:
+            for user_key, cards in self.pending.items():
+                batch.setdefault(user_key, []).extend(cards)
+            self.pending = batch
+            self.pending_count += count
+            self.in_flight = {}
+
+    def _write_each(self, batch: dict, final: bool = False) -> tuple:
+        """
+        Write a batch card by card and quarantine the cards that fail. Cards failing
+        with TRANSIENT_ERRORS are kept to be retried instead, unless final. Returns
+        (how many were quarantined, user_id -> cards to retry).
+        """
+        failed = []
+        retry = {}
+        for user_key, cards in batch.items():
+            for card in cards:
+                try:
+                    self.inner.add_cards({user_key: [card]})
+                except Exception as e:
+                    if isinstance(e, TRANSIENT_ERRORS) and not final:
+                        retry.setdefault(user_key, []).append(card)
+                        continue
+                    # Make sure the inner store won't write it later, or fail the next cards with it.
+                    self.inner.discard_unsaved(user_key, {_serial_number(card)})
+                    failed.append({"user_id": user_key, "card": card_to_dict(card), "error": str(e)})
+        if failed:
+            self._quarantine(failed)
+        return len(failed), retry
+
+    @staticmethod
+    def _quarantine(failed: list) -> None:
+        for entry in failed:
+            print(f"Could not save card {entry['card'].get('serial_number')} for user {entry['user_id']}: "
+                  f"{entry['error']}")
+        try:
+            with open(QUARANTINE_FILE, "a", encoding="utf-8") as f:
+                for entry in failed:
+                    # repr() whatever JSON can't hold; the card may be bad for exactly that reason.
+                    f.write(json.dumps(entry, default=repr) + "\n")
+            print(f"Moved {len(failed)} unsaved cards to {QUARANTINE_FILE}")
+        except OSError as e:
+            # Last resort: keep them in the log so they can be restored by hand.
+            print(f"Could not write {QUARANTINE_FILE} ({e}); unsaved cards: {json.dumps(failed, default=repr)}")
+
+    def replay_quarantine(self) -> int:
+        """
+        Write the cards in QUARANTINE_FILE through the inner store, skipping any it
+        already has, and keep only the ones that still fail; returns how many were restored.
+        """
+        with self.flush_lock:
+            try:
+                with open(QUARANTINE_FILE, "r", encoding="utf-8") as f:
+                    entries = [json.loads(line) for line in f if line.strip()]
+            except FileNotFoundError:
+                return 0
+            stored = {}  # user_id -> serial numbers the inner store has
+            kept = []
+            restored = 0
+            for entry in entries:
+                user_key, card = entry["user_id"], entry["card"]
+                if user_key not in stored:
+                    stored[user_key] = {_serial_number(c) for c in self.inner.load_user(user_key)}
+                if card["serial_number"] in stored[user_key]:
+                    continue
+                try:
+                    self.inner.add_cards({user_key: [card]})
+                except Exception as e:
+                    self.inner.discard_unsaved(user_key, {card["serial_number"]})
+                    kept.append(dict(entry, error=str(e)))
+                    continue
+                stored[user_key].add(card["serial_number"])
+                restored += 1
+            if kept:
+                tmp_path = QUARANTINE_FILE + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(entry, default=repr) + "\n" for entry in kept)
+                os.replace(tmp_path, QUARANTINE_FILE)
+            else:
+                os.remove(QUARANTINE_FILE)
+            print(f"Restored {restored} quarantined cards from {QUARANTINE_FILE}"
+                  + (f"; {len(kept)} still cannot be saved" if kept else ""))
+            return restored
+
+    def start(self) -> None:
+        if self._task is None:
+            # Before any user is loaded, so restored cards show up in their collections.
+            try:
+                self.replay_quarantine()
+            except Exception as e:
+                print(f"Error restoring quarantined cards: {e}")
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await loop.run_in_executor(None, self.flush)
+            except Exception as e:
+                print(f"Error flushing collections: {e}")
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Waits for any flush still running in the executor, then writes the rest.
+        self.close()
+
+    def close(self) -> None:
+        try:
+            self.flush(isolate=True)
+        finally:
+            self.inner.close()
+
+class InstrumentedStore(CollectionStore):
+    """
+    Times every operation of another store into the metrics module: reads and
+    writes per backend and operation, and serial allocation on its own. open_store
+    only adds it with metrics turned on.
+    """
+
+    def __init__(self, inner: CollectionStore):
+        self.inner = inner
+        self.backend = getattr(inner, "name", type(inner).__name__)
+
+    def load_collections(self) -> dict:
+        with metrics.storage_duration.time(self.backend, "load_collections"):
+            return self.inner.load_collections()
+
+    def iter_collections(self):
+        # Only time spent inside the backend counts, not the caller's work between users.
+        elapsed = 0.0
+        users = iter(self.inner.iter_collections())
+        try:
+            while True:
+                started = time.perf_counter()
+                item = next(users, None)
+                elapsed += time.perf_counter() - started
+                if item is None:
+                    return
+                yield item
+        finally:
+            metrics.storage_duration.observe(elapsed, self.backend, "iter_collections")
+
+    def load_user(self, user_key: str) -> list:
+        with metrics.storage_duration.time(self.backend, "load_user"):
+            return self.inner.load_user(user_key)
+
+    def save_collections(self, collections: dict) -> None:
+        with metrics.storage_duration.time(self.backend, "save_collections"):
+            self.inner.save_collections(collections)
+
+    def add_card(self, user_key: str, card_data: dict) -> None:
+        with metrics.storage_duration.time(self.backend, "add_card"):
+            self.inner.add_card(user_key, card_data)
+
+    def add_cards(self, batch: dict) -> None:
+        with metrics.storage_duration.time(self.backend, "add_cards"):
+            self.inner.add_cards(batch)
+
+    def discard_unsaved(self, user_key: str, serials: set) -> None:
+        self.inner.discard_unsaved(user_key, serials)
+
+    def allocate_serial_number(self, prefix: str) -> int:
+        with metrics.serial_allocation.time("single"):
+            return self.inner.allocate_serial_number(prefix)
+
+    def allocate_serial_blocks(self, block_sizes: dict) -> dict:
+        with metrics.serial_allocation.time("block"):
+            return self.inner.allocate_serial_blocks(block_sizes)
+
+    def start(self) -> None:
+        self.inner.start()
+
+    async def shutdown(self) -> None:
+        await self.inner.shutdown()
+
+    def close(self) -> None:
+        self.inner.close()
+
+def migrate_json_to_sqlite(store: SqliteCollectionStore, json_path: str = COLLECTION_FILENAME) -> int:
+    """
+    One-shot import of collections.json (and the serial counters derived from it)
+    into a SQLite store. The file is streamed one user at a time, inside a single
+    transaction; returns the number of cards imported. The JSON file is left
+    untouched as a backup.
+    """
+    counts = {}
+    imported = 0
+    with store.lock:
+        store.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for user_key, user_cards, _, _ in json_stream.iter_object(json_path):
+                imported += store._insert_cards(user_key, user_cards, ignore_duplicates=True)
+                persistence.count_serials(counts, user_cards)
+            # Never move a counter backwards if card_counts.json is ahead of the claimed cards.
+            for prefix, number in persistence.load_card_counts().items():
+                if "|" not in prefix and number > counts.get(prefix, 0):
+                    counts[prefix] = number
+            store.conn.executemany(
+                "INSERT INTO serial_counters (prefix, last_number) VALUES (?, ?) "
+                "ON CONFLICT(prefix) DO UPDATE SET last_number = MAX(last_number, excluded.last_number)",
+                list(counts.items())
+            )
+            store.conn.execute("COMMIT")
+        except Exception:
+            store.conn.execute("ROLLBACK")
+            raise
+    return imported
+
+def open_store(backend: str = None) -> CollectionStore:
+    """
+    Open the configured storage backend. The first time the sqlite backend starts
+    with an empty database next to an existing collections.json, it is migrated;
+    the first time the sharded backend starts, collections.json is split into shards.
+    With metrics on, the backend is wrapped in an InstrumentedStore, and with
+    WRITE_BEHIND on, in a WriteBehindStore around that.
+    """
+    backend = (backend or STORAGE_BACKEND).lower()
+    if backend == "json":
+        store = JsonCollectionStore()
+    elif backend == "sharded":
+        if read_shard_index() is None and os.path.exists(COLLECTION_FILENAME):
+            users = split_collections()
+            print(f"Split {users} users from {COLLECTION_FILENAME} into {SHARD_COUNT} shards in {SHARD_DIR}")
+        store = ShardedJsonCollectionStore()
+    elif backend == "sqlite":
+        store = SqliteCollectionStore()
+        if store.is_empty() and os.path.exists(COLLECTION_FILENAME):
+            imported = migrate_json_to_sqlite(store)
+            print(f"Migrated {imported} cards from {COLLECTION_FILENAME} to {DATABASE_FILE}")
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    if metrics.METRICS_ENABLED:
+        store = InstrumentedStore(store)
+    if WRITE_BEHIND:
+        store = WriteBehindStore(store)
+    return store
+
+# Run the migration by hand: python storage.py
+# or split collections.json into shards: python storage.py split [shard count]
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["split"]:
+        shards = int(sys.argv[2]) if len(sys.argv) > 2 else SHARD_COUNT
+        users = split_collections(shard_count=shards)
+        print(f"Split {users} users from {COLLECTION_FILENAME} into {shards} shards in {SHARD_DIR}")
+    else:
+        sqlite_store = SqliteCollectionStore()
+        count = migrate_json_to_sqlite(sqlite_store)
+        print(f"Migrated {count} cards from {COLLECTION_FILENAME} to {DATABASE_FILE}")
+        sqlite_store.close()